@@ -0,0 +1,13 @@
+"""Benchmarks for the Census Crunch.
+
+Run them from the repository root, e.g. "python -m benchmarks.converters". They
+use the same settings as manage.py; Django is set up when this package is
+imported, so the benchmarks can import the censuscrunch modules right away.
+"""
+
+import django
+
+from censuscrunch import set_django_settings_module
+
+set_django_settings_module()
+django.setup()
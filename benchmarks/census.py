@@ -0,0 +1,258 @@
+"""Generate a synthetic FMCSA census file.
+
+Usage: python -m benchmarks.census number_of_rows [filename]
+
+The file has the same columns as the real one and roughly the same value
+distributions (carriers per state, share of hazmat carriers, empty optional
+fields, long-tailed fleet sizes, and so on), so that importing it costs about
+as much per row as importing the real thing. The output is deterministic for a
+given number of rows and seed.
+"""
+
+import csv
+import itertools
+import random
+import sys
+
+from censuscrunch.management.commands.importcsv import CARRIER_ATTRIBUTES
+
+# Approximate share of carriers per state, in percent.
+STATE_WEIGHTS = {
+    "CA": 10.5,
+    "TX": 9.5,
+    "FL": 6.5,
+    "IL": 4.5,
+    "NY": 4.0,
+    "PA": 3.8,
+    "OH": 3.5,
+    "GA": 3.4,
+    "NJ": 3.0,
+    "NC": 3.0,
+    "MI": 2.8,
+    "IN": 2.5,
+    "WA": 2.3,
+    "TN": 2.2,
+    "VA": 2.1,
+    "MO": 2.0,
+    "WI": 2.0,
+    "MN": 1.9,
+    "AZ": 1.8,
+    "AL": 1.7,
+    "SC": 1.6,
+    "KY": 1.5,
+    "LA": 1.5,
+    "CO": 1.5,
+    "OK": 1.5,
+    "IA": 1.5,
+    "OR": 1.3,
+    "MD": 1.3,
+    "MA": 1.3,
+    "AR": 1.2,
+    "MS": 1.2,
+    "KS": 1.1,
+    "NE": 1.0,
+    "UT": 1.0,
+    "CT": 0.8,
+    "NV": 0.8,
+    "ID": 0.7,
+    "NM": 0.7,
+    "WV": 0.6,
+    "MT": 0.6,
+    "SD": 0.5,
+    "ND": 0.5,
+    "ME": 0.4,
+    "NH": 0.4,
+    "WY": 0.3,
+    "DE": 0.3,
+    "HI": 0.2,
+    "RI": 0.2,
+    "VT": 0.2,
+    "AK": 0.2,
+    "PR": 0.2,
+    "DC": 0.05,
+}
+STATES = tuple(STATE_WEIGHTS)
+CUMULATIVE_STATE_WEIGHTS = tuple(itertools.accumulate(STATE_WEIGHTS.values()))
+
+CITIES = (
+    "SPRINGFIELD",
+    "FRANKLIN",
+    "GREENVILLE",
+    "CLINTON",
+    "SALEM",
+    "FAIRVIEW",
+    "MADISON",
+    "GEORGETOWN",
+    "ARLINGTON",
+    "ASHLAND",
+    "BURLINGTON",
+    "MANCHESTER",
+    "MILTON",
+    "NEWPORT",
+    "OXFORD",
+    "RIVERSIDE",
+)
+SURNAMES = (
+    "SMITH",
+    "JOHNSON",
+    "WILLIAMS",
+    "BROWN",
+    "JONES",
+    "GARCIA",
+    "MILLER",
+    "DAVIS",
+    "RODRIGUEZ",
+    "MARTINEZ",
+    "HERNANDEZ",
+    "LOPEZ",
+    "GONZALEZ",
+    "WILSON",
+    "ANDERSON",
+    "THOMAS",
+    "TAYLOR",
+    "MOORE",
+    "JACKSON",
+    "MARTIN",
+)
+FIRST_NAMES = (
+    "JAMES",
+    "MARY",
+    "JOHN",
+    "PATRICIA",
+    "ROBERT",
+    "JENNIFER",
+    "MICHAEL",
+    "LINDA",
+    "DAVID",
+    "MARIA",
+    "JOSE",
+    "ALICE",
+)
+NAME_WORDS = (
+    "EXPRESS",
+    "FREIGHT",
+    "LOGISTICS",
+    "TRANSPORT",
+    "TRUCKING",
+    "HAULING",
+    "CARRIERS",
+    "DELIVERY",
+    "MOVING",
+    "ENTERPRISES",
+    "BROTHERS",
+    "AND SONS",
+)
+NAME_PREFIXES = (
+    "AMERICAN",
+    "BLUE RIDGE",
+    "COASTAL",
+    "EAGLE",
+    "GOLDEN STATE",
+    "INTERSTATE",
+    "LONE STAR",
+    "MIDWEST",
+    "NATIONAL",
+    "PIONEER",
+    "ROADRUNNER",
+    "SUMMIT",
+)
+NAME_SUFFIXES = ("LLC", "INC", "CORP", "CO", "LTD", "")
+STREET_NAMES = ("MAIN", "OAK", "PINE", "MAPLE", "CEDAR", "ELM", "LAKE", "HILL")
+STREET_TYPES = ("ST", "AVE", "RD", "DR", "BLVD", "HWY", "LN")
+MONTHS = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN")
+MONTHS += ("JUL", "AUG", "SEP", "OCT", "NOV", "DEC")
+
+
+def make_date(rng, first_year=1975, last_year=2020):
+    year = rng.randint(first_year, last_year)
+    return f"{rng.randint(1, 28):02}-{rng.choice(MONTHS)}-{year % 100:02}"
+
+
+def make_legal_name(rng):
+    # About a third of the carriers are owner-operators registered in their own
+    # name, which is where most of the commas in the file come from.
+    if rng.random() < 0.35:
+        return f"{rng.choice(SURNAMES)}, {rng.choice(FIRST_NAMES)}"
+    name = f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_WORDS)}"
+    suffix = rng.choice(NAME_SUFFIXES)
+    return f"{name} {suffix}" if suffix else name
+
+
+def make_address(rng):
+    street = f"{rng.randint(1, 29999)} {rng.choice(STREET_NAMES)}"
+    return (
+        f"{street} {rng.choice(STREET_TYPES)}",
+        rng.choice(CITIES),
+        rng.choices(STATES, cum_weights=CUMULATIVE_STATE_WEIGHTS)[0],
+        f"{rng.randint(501, 99950):05}",
+        "US",
+    )
+
+
+def make_phone(rng):
+    area_code, exchange = rng.randint(201, 989), rng.randint(200, 999)
+    return f"({area_code}) {exchange}-{rng.randint(0, 9999):04}"
+
+
+def make_fleet_size(rng):
+    # Most carriers have a truck or two; a few have thousands.
+    return min(int(rng.paretovariate(1.2)), 50_000)
+
+
+def make_row(dot_number, rng=random):
+    """Return a census row (a list of strings) for the specified DOT number."""
+    legal_name = make_legal_name(rng)
+    dba_name = make_legal_name(rng) if rng.random() < 0.15 else ""
+    physical_address = make_address(rng)
+    if rng.random() < 0.8:
+        mailing_address = physical_address
+    else:
+        mailing_address = make_address(rng)
+    power_units = make_fleet_size(rng)
+    email = legal_name.split(",")[0].replace(" ", "").lower()
+    return [
+        str(dot_number),
+        legal_name,
+        dba_name,
+        rng.choices("ABC", cum_weights=(70, 72, 100))[0],
+        "Y" if rng.random() < 0.05 else "N",
+        "Y" if rng.random() < 0.04 else "N",
+        *physical_address,
+        *mailing_address,
+        make_phone(rng),
+        make_phone(rng) if rng.random() < 0.15 else "",
+        f"{email}@example.com" if rng.random() < 0.8 else "",
+        make_date(rng, 2000) if rng.random() < 0.95 else "",
+        str(power_units * rng.randint(0, 120_000)) if rng.random() < 0.9 else "",
+        str(rng.randint(2000, 2020)) if rng.random() < 0.9 else "",
+        make_date(rng),
+        physical_address[2],
+        str(power_units),
+        str(max(power_units + rng.randint(-1, 2), 0)),
+    ]
+
+
+def write_census(f, number_of_rows, seed=42):
+    """Write a census file with the specified number of rows to text file f."""
+    rng = random.Random(seed)
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(CARRIER_ATTRIBUTES.keys())
+    dot_number = 0
+    for i in range(number_of_rows):
+        dot_number += rng.randint(1, 3)
+        writer.writerow(make_row(dot_number, rng))
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        sys.exit(__doc__.splitlines()[2])
+    number_of_rows = int(sys.argv[1])
+    if len(sys.argv) == 2:
+        write_census(sys.stdout, number_of_rows)
+        return
+    with open(sys.argv[2], "w", newline="") as f:
+        write_census(f, number_of_rows)
+
+
+if __name__ == "__main__":
+    main()
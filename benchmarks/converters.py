@@ -0,0 +1,67 @@
+"""Compare the import's row conversion with a plain strptime-based one.
+
+Usage: python -m benchmarks.converters [number_of_rows]
+"""
+
+import datetime as dt
+import random
+import sys
+import time
+
+from benchmarks.census import make_row
+from censuscrunch.management.commands.importcsv import (
+    CARRIER_ATTRIBUTES,
+    convert_row,
+    get_content_hash,
+    str2bool,
+    str2date,
+    str2int,
+)
+
+
+def reference_str2date(s):
+    if s:
+        return dt.datetime.strptime(s, "%d-%b-%y").date()
+    else:
+        return None
+
+
+REFERENCE_CONVERSION_FUNCTIONS = {
+    str2bool: str2bool,
+    str2date: reference_str2date,
+    str2int: str2int,
+}
+
+
+def reference_convert_row(row):
+    result = []
+    for attr, value in zip(CARRIER_ATTRIBUTES.values(), row):
+        convert = attr.conversion_function
+        result.append(REFERENCE_CONVERSION_FUNCTIONS.get(convert, convert)(value))
+    result.append(result[2] or result[1])
+    result.append(get_content_hash(row))
+    return result
+
+
+def time_conversion(convert, rows):
+    start_time = time.perf_counter()
+    result = [convert(row) for row in rows]
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    number_of_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(42)
+    rows = [make_row(i, rng) for i in range(1, number_of_rows + 1)]
+    str2date.cache_clear()
+    reference_result, reference_time = time_conversion(reference_convert_row, rows)
+    result, new_time = time_conversion(convert_row, rows)
+    if result != reference_result:
+        sys.exit("The results differ")
+    print(f"reference: {number_of_rows / reference_time:12,.0f} rows/s")
+    print(f"importcsv: {number_of_rows / new_time:12,.0f} rows/s")
+    print(f"speed-up:  {reference_time / new_time:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
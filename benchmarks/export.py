@@ -0,0 +1,91 @@
+"""Compare the CSV export with one that instantiates a Carrier for each row.
+
+Usage: python -m benchmarks.export [number_of_rows] [--data-dir DIR]
+
+It imports a synthetic census file (see benchmarks.importcsv) into a fresh test
+database, exports all of it both ways, checks that the outputs are identical
+and reports the rows per second of each.
+"""
+
+import argparse
+import csv
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+
+from benchmarks.importcsv import get_census_file
+from censuscrunch import export
+from censuscrunch.models import Carrier
+
+
+def reference_format(value):
+    if value is True or value is False:
+        return "NY"[value]
+    elif isinstance(value, dt.date):
+        return value.strftime("%d-%b-%y").upper()
+    else:
+        return value
+
+
+def reference_generate_csv(queryset, chunk_size=2000, buffer_size=64 * 1024):
+    buffer = StringIO()
+    csvwriter = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    csvwriter.writerow(export.CSV_HEADINGS)
+    for carrier in queryset.iterator(chunk_size=chunk_size):
+        row = [getattr(carrier, field) for field in export.CSV_FIELDS]
+        csvwriter.writerow([reference_format(value) for value in row])
+        if buffer.tell() >= buffer_size:
+            yield export._flush(buffer)
+    if buffer.tell():
+        yield export._flush(buffer)
+
+
+def time_export(generate_csv):
+    export.format_date.cache_clear()
+    queryset = Carrier.objects.order_by("dot_number")
+    start_time = time.perf_counter()
+    result = b"".join(generate_csv(queryset))
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the CSV export with a per-model one."
+    )
+    parser.add_argument("rows", type=int, nargs="?", default=100_000)
+    parser.add_argument(
+        "--data-dir",
+        default=os.path.join(tempfile.gettempdir(), "censuscrunch-benchmarks"),
+        help="Where to keep the generated census files (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    os.makedirs(args.data_dir, exist_ok=True)
+    filename = get_census_file(args.data_dir, args.rows)
+
+    if connection.vendor == "sqlite":
+        test_database_name = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+        connection.settings_dict["TEST"]["NAME"] = test_database_name
+    old_database_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        call_command("importcsv", filename, stdout=StringIO(), stderr=StringIO())
+        number_of_rows = Carrier.objects.count()
+        reference_result, reference_time = time_export(reference_generate_csv)
+        result, new_time = time_export(export.generate_csv)
+    finally:
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+    if result != reference_result:
+        sys.exit("The results differ")
+    print(f"reference: {number_of_rows / reference_time:12,.0f} rows/s")
+    print(f"export:    {number_of_rows / new_time:12,.0f} rows/s")
+    print(f"speed-up:  {reference_time / new_time:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Measure the throughput of "importcsv" on synthetic census files.
+
+Usage: python -m benchmarks.importcsv [--rows N [N ...]] [--data-dir DIR] [--json]
+                                      [-- importcsv options]
+
+For each number of rows it generates a census file with benchmarks.census (the
+files are kept in the data directory, so that they are generated only once),
+and then, in a fresh process and on a fresh test database, it times
+
+  read     reading and splitting the CSV records,
+  convert  converting the records to Python values (excluding reading),
+  import   "importcsv" from start to finish,
+  write    the part of the import spent writing to the database,
+  commit   the part of the import spent committing,
+
+and reports the import's rows per second and the peak resident set size of the
+process (including any worker processes). Anything after "--" is passed to
+importcsv, e.g. "-- --engine copy --workers 4".
+
+The database is whatever the settings say, so to benchmark PostgreSQL run it
+with DJANGO_SETTINGS_MODULE=censuscrunch_project.settings.travis or similar.
+"""
+
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+
+from benchmarks.census import write_census
+from censuscrunch.management.commands.importcsv import convert_row, open_input
+
+DEFAULT_ROWS = (10_000, 100_000)
+
+
+def get_peak_rss():
+    """Return the peak RSS, in MiB, of this process and its finished children."""
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in KiB, except on macOS, where it's in bytes.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def time_reading(filename, convert=None):
+    start_time = time.perf_counter()
+    with open_input(filename) as f:
+        csvreader = csv.reader(f)
+        next(csvreader)
+        for row in csvreader:
+            if convert:
+                convert(row)
+    return time.perf_counter() - start_time
+
+
+def run(filename, importcsv_args):
+    """Benchmark importing filename; return the results as a dictionary."""
+    if connection.vendor == "sqlite":
+        # The default test database for SQLite is in memory, which is not what we
+        # want to measure.
+        test_database_name = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+        connection.settings_dict["TEST"]["NAME"] = test_database_name
+    old_database_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        read_time = time_reading(filename)
+        convert_time = time_reading(filename, convert_row) - read_time
+        output = StringIO()
+        start_time = time.perf_counter()
+        call_command(
+            "importcsv", filename, "--json-progress", *importcsv_args, stdout=output
+        )
+        import_time = time.perf_counter() - start_time
+        import_stats = json.loads(output.getvalue().splitlines()[-1])
+    finally:
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+    return {
+        "database": connection.vendor,
+        "read": read_time,
+        "convert": convert_time,
+        "import": import_time,
+        "write": import_stats["seconds"]["write"],
+        "commit": import_stats["seconds"]["commit"],
+        "peak_rss": get_peak_rss(),
+    }
+
+
+def get_census_file(data_dir, rows):
+    filename = os.path.join(data_dir, f"census-{rows}.csv")
+    if not os.path.exists(filename):
+        print(f"Generating {filename}...", file=sys.stderr)
+        with open(filename + ".tmp", "w", newline="") as f:
+            write_census(f, rows)
+        os.rename(filename + ".tmp", filename)
+    return filename
+
+
+def benchmark(rows, data_dir, importcsv_args):
+    filename = get_census_file(data_dir, rows)
+    command = [sys.executable, "-m", "benchmarks.importcsv", "--run", filename]
+    output = subprocess.run(
+        command + ["--"] + importcsv_args,
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stdout
+    result = {"rows": rows, **json.loads(output)}
+    result["rows_per_second"] = rows / result["import"]
+    return result
+
+
+def print_table(results):
+    print(
+        f"{'rows':>10} {'database':>10} {'read s':>8} {'convert s':>10} "
+        f"{'import s':>9} {'write s':>8} {'commit s':>9} {'rows/s':>9} "
+        f"{'peak RSS MiB':>13}"
+    )
+    for r in results:
+        print(
+            f"{r['rows']:>10,} {r['database']:>10} {r['read']:>8.2f} "
+            f"{r['convert']:>10.2f} {r['import']:>9.2f} {r['write']:>8.2f} "
+            f"{r['commit']:>9.2f} "
+            f"{r['rows_per_second']:>9,.0f} {r['peak_rss']:>13,.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of importcsv on synthetic census files."
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=DEFAULT_ROWS,
+        help="Numbers of rows to benchmark (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=os.path.join(tempfile.gettempdir(), "censuscrunch-benchmarks"),
+        help="Where to keep the generated census files (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON lines"
+    )
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("importcsv_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    importcsv_args = args.importcsv_args
+    if importcsv_args[:1] == ["--"]:
+        importcsv_args = importcsv_args[1:]
+
+    if args.run:
+        print(json.dumps(run(args.run, importcsv_args)))
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for rows in args.rows:
+        results.append(benchmark(rows, args.data_dir, importcsv_args))
+        if args.json:
+            print(json.dumps(results[-1]))
+    if not args.json:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
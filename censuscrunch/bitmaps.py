@@ -0,0 +1,193 @@
+"""Bitmap indexes of the carriers' low-cardinality attributes.
+
+For each value of each field in FIELDS there's a bitmap of the rows that have
+that value; a row is a carrier's position in the columnar engine's files (see
+censuscrunch.columnar), which write the bitmaps along with the columns. A
+bitmap is stored as packed bits, one per row, unless few rows have the value,
+in which case it is stored as the sorted array of these rows, which is
+smaller; Roaring bitmaps make the same choice (per chunk of rows). For the 1.7
+million carriers, combining and counting a few bitmaps takes well under a
+millisecond.
+
+The bitmaps of a field are stored in files "bitmaps/FIELD.N.npy", where N is
+the index of the value in the list of values of the field that bitmaps.json
+contains, and they are memory-mapped when loaded.
+"""
+
+import json
+import os
+from functools import reduce
+
+try:
+    import numpy as np
+except ImportError:  # Like the columnar engine, this is optional
+    np = None
+
+FIELDS = (
+    "physical_state",
+    "mailing_state",
+    "oic_state",
+    "carrier_operation",
+    "hm",
+    "pc",
+)
+
+
+def _popcount(bits):
+    if hasattr(np, "bitwise_count"):  # NumPy 2
+        return int(np.bitwise_count(bits).sum())
+    return int(np.unpackbits(bits).sum())
+
+
+class Bitmap:
+    """A set of rows of a table with "size" rows.
+
+    Exactly one of "rows" (a sorted array of row numbers) and "bits" (a packed
+    array of bits) is set.
+    """
+
+    def __init__(self, size, rows=None, bits=None):
+        self.size = size
+        self.rows = rows
+        self.bits = bits
+
+    @classmethod
+    def from_rows(cls, rows, size):
+        rows = np.asarray(rows, dtype=np.int64)
+        # A row number takes 32 bits, in a file or in a packed array
+        if len(rows) * 32 < size:
+            return cls(size, rows=rows.astype(np.uint32))
+        mask = np.zeros(size, dtype=bool)
+        mask[rows] = True
+        return cls(size, bits=np.packbits(mask))
+
+    @classmethod
+    def full(cls, size):
+        return cls(size, bits=np.packbits(np.ones(size, dtype=bool)))
+
+    def __len__(self):
+        if self.rows is not None:
+            return len(self.rows)
+        return _popcount(self.bits)
+
+    def __and__(self, other):
+        if self.rows is None and other.rows is None:
+            return Bitmap(self.size, bits=self.bits & other.bits)
+        if self.rows is not None and other.rows is not None:
+            # Look up the rows of the smaller in the larger
+            small, large = sorted((self.rows, other.rows), key=len)
+            positions = np.searchsorted(large, small)
+            found = positions < len(large)
+            found[found] = large[positions[found]] == small[found]
+            return Bitmap(self.size, rows=small[found])
+        sparse, dense = (self, other) if self.rows is not None else (other, self)
+        return Bitmap(self.size, rows=sparse.rows[dense._contains(sparse.rows)])
+
+    def __or__(self, other):
+        if self.rows is not None and other.rows is not None:
+            # Not np.union1d(), which is slower
+            rows = np.sort(np.concatenate((self.rows, other.rows)))
+            is_first = np.concatenate(([True], rows[1:] != rows[:-1]))
+            return Bitmap(self.size, rows=rows[is_first])
+        return Bitmap(self.size, bits=self.to_bits() | other.to_bits())
+
+    def _contains(self, rows):
+        # For packed bits; the first row is the most significant bit of a byte
+        rows = rows.astype(np.int64)
+        return (self.bits[rows >> 3] >> (7 - (rows & 7))) & 1 == 1
+
+    def to_bits(self):
+        if self.bits is not None:
+            return self.bits
+        return np.packbits(self.to_mask())
+
+    def to_mask(self):
+        """Return a boolean array that is True at the rows of the bitmap."""
+        if self.bits is not None:
+            return np.unpackbits(self.bits, count=self.size).astype(bool)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.rows] = True
+        return mask
+
+    def to_rows(self):
+        if self.rows is not None:
+            return self.rows.astype(np.int64)
+        return np.flatnonzero(self.to_mask())
+
+
+def write_bitmap_index(directory, columns, size):
+    """Write the bitmaps of the columns into directory/bitmaps.
+
+    "columns" maps each field in FIELDS to the sequence of its values, in row
+    order.
+    """
+    bitmaps_directory = os.path.join(directory, "bitmaps")
+    os.makedirs(bitmaps_directory)
+    metadata = {"size": size, "fields": {}}
+    for field in FIELDS:
+        values, rows = _group_rows(np.array(columns[field]))
+        metadata["fields"][field] = values
+        for i, value_rows in enumerate(rows):
+            bitmap = Bitmap.from_rows(value_rows, size)
+            array = bitmap.bits if bitmap.rows is None else bitmap.rows
+            np.save(os.path.join(bitmaps_directory, f"{field}.{i}.npy"), array)
+    with open(os.path.join(directory, "bitmaps.json"), "w") as f:
+        json.dump(metadata, f)
+
+
+def _group_rows(values):
+    """Return the distinct values and, for each, the rows that have it."""
+    if not len(values):
+        return [], []
+    distinct, inverse = np.unique(values, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    boundaries = np.cumsum(np.bincount(inverse, minlength=len(distinct)))[:-1]
+    return [x.item() for x in distinct], np.split(order, boundaries)
+
+
+class BitmapIndex:
+    def __init__(self, directory):
+        with open(os.path.join(directory, "bitmaps.json")) as f:
+            metadata = json.load(f)
+        self.size = metadata["size"]
+        self.bitmaps = {}
+        for field, values in metadata["fields"].items():
+            self.bitmaps[field] = {}
+            for i, value in enumerate(values):
+                filename = os.path.join(directory, "bitmaps", f"{field}.{i}.npy")
+                array = np.load(filename, mmap_mode="r")
+                if array.dtype == np.uint8:
+                    bitmap = Bitmap(self.size, bits=array)
+                else:
+                    bitmap = Bitmap(self.size, rows=array)
+                self.bitmaps[field][value] = bitmap
+
+    def get(self, field, value):
+        """Return the bitmap of the rows where field has the specified value."""
+        bitmap = self.bitmaps[field].get(value)
+        return self._get_empty_bitmap() if bitmap is None else bitmap
+
+    def _get_empty_bitmap(self):
+        return Bitmap(self.size, rows=np.array([], dtype=np.uint32))
+
+    def select(self, conditions):
+        """Return the bitmap of the rows that satisfy the conditions.
+
+        "conditions" maps fields to a value or to a list, tuple or set of values;
+        a row satisfies them if, for every field, it has one of the values.
+        """
+        field_bitmaps = []
+        for field, values in conditions.items():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            bitmaps = [self.get(field, value) for value in values]
+            if not bitmaps:
+                return self._get_empty_bitmap()
+            field_bitmaps.append(reduce(Bitmap.__or__, bitmaps))
+        if not field_bitmaps:
+            return Bitmap.full(self.size)
+        # Start with the smallest, so that the intermediate results are small
+        return reduce(Bitmap.__and__, sorted(field_bitmaps, key=len))
+
+    def count(self, conditions):
+        return len(self.select(conditions))
@@ -0,0 +1,231 @@
+"""An optional in-memory columnar engine for searching carriers.
+
+If CENSUSCRUNCH_COLUMNS_DIR is set and NumPy is installed, importcsv writes the
+columns that searches filter and sort by to a subdirectory of that directory
+named after the data generation. Each process memory-maps the files of the
+current generation the first time it needs them, so the operating system
+shares their pages among all processes (e.g. gunicorn workers).
+
+The engine filters, sorts and counts with vectorised NumPy operations, and the
+database is only asked for the carriers of the page being displayed. The
+results are the same as the database's, provided that the database sorts
+names by code point, as SQLite and PostgreSQL's "C" collation do. Names are
+matched case-insensitively after Python's str.upper(), which differs from the
+database only for some non-ASCII characters.
+
+The files are:
+
+  metadata.json       the number of rows and the distinct states
+  ids.npy             the carriers' primary keys, in dot_number order
+  physical_state.npy  the index of each carrier's state in the list of states
+  number_of_power_units.npy, number_of_drivers.npy
+                      the numbers, with -1 for NULL
+  name_rank.npy       the position of each carrier's name in the sorted names
+  names.bin           for each carrier, its upper-cased legal name and DBA
+                      name, separated by a NUL and followed by a newline
+  names_offsets.npy   where each carrier's names start in names.bin, plus the
+                      size of names.bin
+  bitmaps.json, bitmaps/
+                      bitmap indexes of the low-cardinality attributes (see
+                      censuscrunch.bitmaps), which the state filter uses
+"""
+
+import json
+import mmap
+import os
+import re
+import threading
+
+from django.conf import settings
+
+from . import bitmaps
+from .generation_dirs import build_generation_directory
+from .models import Carrier, DataGeneration
+
+try:
+    import numpy as np
+except ImportError:  # The engine is optional
+    np = None
+
+NUMERIC_COLUMNS = ("number_of_power_units", "number_of_drivers")
+NULL = -1
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def is_enabled():
+    return bool(settings.CENSUSCRUNCH_COLUMNS_DIR) and np is not None
+
+
+def get_engine():
+    """Return the engine for the current data, or None if there's none."""
+    global _engine
+    generation = DataGeneration.current() if is_enabled() else None
+    if generation is None:
+        return None
+    directory = os.path.join(settings.CENSUSCRUNCH_COLUMNS_DIR, str(generation))
+    with _engine_lock:
+        if _engine is None or _engine.directory != directory:
+            if not os.path.isdir(directory):
+                # Not built yet, or it failed
+                return None
+            _engine = ColumnarEngine(directory)
+        return _engine
+
+
+def build_columns(generation):
+    """Write the column files for the carriers of the specified data generation.
+
+    The files of other generations are removed.
+    """
+    build_generation_directory(
+        settings.CENSUSCRUNCH_COLUMNS_DIR, generation, _write_columns
+    )
+
+
+def _write_columns(directory):
+    fields = ("id", *NUMERIC_COLUMNS, "name", "legal_name", "dba_name")
+    fields += tuple(x for x in bitmaps.FIELDS if x not in fields)
+    values = {field: [] for field in fields}
+    rows = Carrier.objects.order_by("dot_number").values_list(*fields)
+    for row in rows.iterator(chunk_size=10_000):
+        for field_values, value in zip(values.values(), row):
+            field_values.append(value)
+    size = len(values["id"])
+
+    name_offsets = [0]
+    with open(os.path.join(directory, "names.bin"), "wb") as f:
+        for legal_name, dba_name in zip(values["legal_name"], values["dba_name"]):
+            names = f"{legal_name.upper()}\0{dba_name.upper()}\n".encode()
+            f.write(names)
+            name_offsets.append(name_offsets[-1] + len(names))
+    states = values["physical_state"]
+    distinct_states = sorted(set(states))
+    state_indexes = {state: i for i, state in enumerate(distinct_states)}
+    name_ranks = {name: i for i, name in enumerate(sorted(set(values["name"])))}
+    columns = {
+        "ids": np.array(values["id"], dtype=np.int64),
+        "physical_state": np.array([state_indexes[x] for x in states], np.uint16),
+        "name_rank": np.array([name_ranks[x] for x in values["name"]], np.uint32),
+        "names_offsets": np.array(name_offsets, dtype=np.int64),
+    }
+    for field in NUMERIC_COLUMNS:
+        numbers = [NULL if x is None else x for x in values[field]]
+        columns[field] = np.array(numbers, dtype=np.int64)
+    for name, array in columns.items():
+        np.save(os.path.join(directory, name + ".npy"), array)
+    bitmaps.write_bitmap_index(directory, values, size)
+    metadata = {"rows": size, "states": distinct_states}
+    with open(os.path.join(directory, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
+
+
+class ColumnarEngine:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "metadata.json")) as f:
+            metadata = json.load(f)
+        self.rows = metadata["rows"]
+        self.bitmaps = bitmaps.BitmapIndex(directory)
+        self.columns = {
+            name: self._load(name)
+            for name in ("ids", "physical_state", "name_rank", *NUMERIC_COLUMNS)
+        }
+        self.names_offsets = self._load("names_offsets")
+        self.names = b""
+        if self.rows:  # An empty file can't be memory-mapped
+            with open(os.path.join(directory, "names.bin"), "rb") as f:
+                self.names = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.directory, name + ".npy"), mmap_mode="r")
+
+    def search(self, filters, sort_order):
+        """Return the carriers that match the filters, sorted.
+
+        filters and sort_order are what SearchView has recorded in its
+        "filters" attribute and what its _get_sort_order() returns.
+        """
+        rows = self._filter(filters)
+        if "q" in filters:
+            rows = np.intersect1d(rows, self._find_name(filters["q"]))
+        rows = self._sort(rows, sort_order)
+        return SearchResult(self.columns["ids"][rows])
+
+    def select(self, conditions):
+        """Return the carriers that satisfy conditions on indexed attributes.
+
+        See bitmaps.BitmapIndex.select() for the conditions. The result is in
+        dot_number order; its length is the count.
+        """
+        return SearchResult(
+            self.columns["ids"][self.bitmaps.select(conditions).to_rows()]
+        )
+
+    def _filter(self, filters):
+        conditions = {}
+        if "state" in filters:
+            conditions["physical_state"] = filters["state"]
+        mask = self.bitmaps.select(conditions).to_mask()
+        power_units = self.columns["number_of_power_units"]
+        if "min_number_of_power_units" in filters:
+            minimum = int(filters["min_number_of_power_units"])
+            mask &= (power_units >= minimum) & (power_units != NULL)
+        if "max_number_of_power_units" in filters:
+            maximum = int(filters["max_number_of_power_units"])
+            mask &= (power_units <= maximum) & (power_units != NULL)
+        return np.flatnonzero(mask)
+
+    def _find_name(self, term):
+        """Return the rows whose legal or DBA name contains term."""
+        needle = term.upper().encode()
+        if b"\0" in needle or b"\n" in needle:
+            return np.array([], dtype=np.int64)
+        positions = np.fromiter(
+            (m.start() for m in re.finditer(re.escape(needle), self.names)),
+            dtype=np.int64,
+        )
+        rows = np.searchsorted(self.names_offsets, positions, side="right") - 1
+        return np.unique(rows)
+
+    def _sort(self, rows, sort_order):
+        # The rows are in dot_number order, so the row number is the tie breaker;
+        # like in pagination.Keyset, it follows the direction of the last column.
+        descending = bool(sort_order) and sort_order[-1].startswith("-")
+        keys = [-rows if descending else rows]
+        for term in reversed(sort_order):
+            name = term.lstrip("-")
+            key = self._get_sort_key(name, rows)
+            keys.append(-key if term.startswith("-") else key)
+        return rows[np.lexsort(keys)]
+
+    def _get_sort_key(self, name, rows):
+        if name == "name":
+            name = "name_rank"
+        values = self.columns[name][rows].astype(np.int64)
+        if name in NUMERIC_COLUMNS:
+            # NULL sorts after everything
+            values[values == NULL] = np.iinfo(np.int64).max
+        return values
+
+
+class SearchResult:
+    """The carriers found by the engine, in order.
+
+    It's a sequence that Django's Paginator can paginate. Slicing it fetches
+    the carriers of the slice from the database.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return Carrier.objects.get(id=self.ids[index])
+        ids = self.ids[index].tolist()
+        carriers = Carrier.objects.in_bulk(ids)
+        return [carriers[x] for x in ids if x in carriers]
@@ -0,0 +1,89 @@
+"""Counting search results without counting all of them.
+
+A search that returns more than CENSUSCRUNCH_ROW_LIMIT rows is rejected, so
+there's no point in counting beyond that; we count at most limit + 1 rows. In
+addition, if CENSUSCRUNCH_ESTIMATE_COUNTS_ABOVE is set, on PostgreSQL we first
+ask the planner for an estimate, and if the estimate is above that number we
+don't count at all.
+
+The counts are cached (in Django's default cache) per set of filters until the
+next import.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import DataGeneration
+
+
+class ResultCount:
+    """How many rows a search returns, as far as we need to know.
+
+    If the search returns more than "limit" rows, "value" is limit + 1, or the
+    planner's estimate if "estimated" is True.
+    """
+
+    def __init__(self, value, limit, estimated=False):
+        self.value = value
+        self.limit = limit
+        self.estimated = estimated
+
+    @property
+    def exceeds_limit(self):
+        return self.value > self.limit
+
+
+def get_cache_key(kind, filters):
+    """Return a cache key for a search with the specified filters.
+
+    "filters" is a JSON-serializable dictionary that identifies the search. The
+    key includes the data generation, so that it changes at every import. If
+    there hasn't been an import, the result is None and nothing must be cached.
+    """
+    generation = DataGeneration.current()
+    if generation is None:
+        return None
+    data = json.dumps(filters, sort_keys=True).encode()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return f"censuscrunch:{kind}:{generation}:{digest}"
+
+
+def count_results(queryset, filters):
+    limit = settings.CENSUSCRUNCH_ROW_LIMIT
+    key = get_cache_key("count", {"filters": filters, "limit": limit})
+    result = cache.get(key) if key else None
+    if result is None:
+        result = _count_results(queryset, limit)
+        if key:
+            cache.set(key, result, None)
+    return result
+
+
+def _count_results(queryset, limit):
+    queryset = queryset.order_by()
+    threshold = settings.CENSUSCRUNCH_ESTIMATE_COUNTS_ABOVE
+    if threshold is not None and connection.vendor == "postgresql":
+        estimate = estimate_count(queryset)
+        if estimate > max(threshold, limit):
+            return ResultCount(estimate, limit, estimated=True)
+    return ResultCount(get_count_queryset(queryset, limit).count(), limit)
+
+
+def get_count_queryset(queryset, limit):
+    """Return the rows that _count_results() counts: at most limit + 1."""
+    return queryset.order_by().values("pk")[: limit + 1]
+
+
+def estimate_count(queryset):
+    """Return PostgreSQL's planner estimate of the number of rows of queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,280 @@
+"""Exporting carriers, as CSV in the format of FMCSA's census file or in others.
+
+The rows are fetched as tuples with values_list() rather than as Carrier
+objects. For CSV, only the columns that need it go through a formatter, chosen
+once per export from the field's type.
+
+The formats are in FORMATS. Each one's "generate" function streams the export
+of a queryset as chunks of bytes:
+
+  csv      CSV, like the census file
+  csv.gz   the same, gzip-compressed
+  jsonl    JSON Lines, with a JSON object per carrier; its keys are the CSV
+           headings, flags are booleans, dates are "YYYY-MM-DD" and empty
+           numbers are null
+  parquet  Apache Parquet, with a row group per ARROW_BATCH_SIZE rows
+  arrow    the Apache Arrow IPC streaming format
+
+The last two are typed like JSON Lines (with dates as dates) and need pyarrow,
+which is optional; without it, they are not in FORMATS.
+"""
+
+import csv
+import functools
+import json
+import zlib
+from collections import OrderedDict, namedtuple
+from io import StringIO
+
+from django.db import models
+
+from .models import Carrier
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # The Parquet and Arrow formats are optional
+    pa = pq = None
+
+# Heading, field
+CSV_COLUMNS = (
+    ("DOT_NUMBER", "dot_number"),
+    ("LEGAL_NAME", "legal_name"),
+    ("DBA_NAME", "dba_name"),
+    ("CARRIER_OPERATION", "carrier_operation"),
+    ("HM_FLAG", "hm"),
+    ("PC_FLAG", "pc"),
+    ("PHY_STREET", "physical_address"),
+    ("PHY_CITY", "physical_city"),
+    ("PHY_STATE", "physical_state"),
+    ("PHY_ZIP", "physical_zip"),
+    ("PHY_COUNTRY", "physical_country"),
+    ("MAILING_STREET", "mailing_address"),
+    ("MAILING_CITY", "mailing_city"),
+    ("MAILING_STATE", "mailing_state"),
+    ("MAILING_ZIP", "mailing_zip"),
+    ("MAILING_COUNTRY", "mailing_country"),
+    ("TELEPHONE", "tel"),
+    ("FAX", "fax"),
+    ("EMAIL_ADDRESS", "email"),
+    ("MCS150_DATE", "mcs150_date"),
+    ("MCS150_MILEAGE", "mcs150_mileage"),
+    ("MCS150_MILEAGE_YEAR", "mcs150_mileage_year"),
+    ("ADD_DATE", "date_added_mcmis"),
+    ("OIC_STATE", "oic_state"),
+    ("NBR_POWER_UNIT", "number_of_power_units"),
+    ("DRIVER_TOTAL", "number_of_drivers"),
+)
+CSV_HEADINGS = [heading for heading, field in CSV_COLUMNS]
+CSV_FIELDS = [field for heading, field in CSV_COLUMNS]
+
+
+def format_flag(value):
+    return "NY"[value]
+
+
+@functools.lru_cache(maxsize=None)
+def format_date(value):
+    # There are only a few thousand distinct dates, and strftime() is slow
+    if value is None:
+        return None
+    return value.strftime("%d-%b-%y").upper()
+
+
+FORMATTERS = {models.BooleanField: format_flag, models.DateField: format_date}
+
+
+def get_formatters(fields=CSV_FIELDS):
+    """Return (index, formatter) for the columns that need to be formatted."""
+    result = []
+    for i, name in enumerate(fields):
+        formatter = FORMATTERS.get(type(Carrier._meta.get_field(name)))
+        if formatter:
+            result.append((i, formatter))
+    return result
+
+
+def format_rows(rows, fields=CSV_FIELDS):
+    formatters = get_formatters(fields)
+    for row in rows:
+        row = list(row)
+        for i, formatter in formatters:
+            row[i] = formatter(row[i])
+        yield row
+
+
+def generate_csv(queryset, chunk_size=2000, buffer_size=64 * 1024):
+    """Yield the rows of queryset as CSV, encoded, buffer_size characters at a time.
+
+    The rows are fetched chunk_size at a time (with a server-side cursor where
+    the database supports it), so memory use doesn't depend on the number of
+    rows.
+    """
+    buffer = StringIO()
+    csvwriter = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    csvwriter.writerow(CSV_HEADINGS)
+    rows = queryset.values_list(*CSV_FIELDS).iterator(chunk_size=chunk_size)
+    for row in format_rows(rows):
+        csvwriter.writerow(row)
+        if buffer.tell() >= buffer_size:
+            yield _flush(buffer)
+    if buffer.tell():
+        yield _flush(buffer)
+
+
+def _flush(buffer):
+    result = buffer.getvalue().encode("us-ascii")
+    buffer.seek(0)
+    buffer.truncate()
+    return result
+
+
+def generate_csv_gz(queryset, chunk_size=2000, buffer_size=64 * 1024):
+    # 16 + MAX_WBITS makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in generate_csv(queryset, chunk_size, buffer_size):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def generate_jsonl(queryset, chunk_size=2000, buffer_size=64 * 1024):
+    encoder = json.JSONEncoder(separators=(",", ":"), default=_encode_date)
+    buffer = StringIO()
+    rows = queryset.values_list(*CSV_FIELDS).iterator(chunk_size=chunk_size)
+    for row in rows:
+        buffer.write(encoder.encode(dict(zip(CSV_HEADINGS, row))))
+        buffer.write("\n")
+        if buffer.tell() >= buffer_size:
+            yield _flush(buffer)
+    if buffer.tell():
+        yield _flush(buffer)
+
+
+def _encode_date(value):
+    return value.isoformat()
+
+
+ARROW_BATCH_SIZE = 10_000
+
+ARROW_TYPES = {
+    models.BooleanField: "bool_",
+    models.DateField: "date32",
+    models.BigIntegerField: "int64",
+    models.PositiveIntegerField: "int64",
+    models.PositiveSmallIntegerField: "int64",
+}
+
+
+def get_arrow_schema():
+    fields = []
+    for heading, name in CSV_COLUMNS:
+        field = Carrier._meta.get_field(name)
+        arrow_type = getattr(pa, ARROW_TYPES.get(type(field), "string"))()
+        fields.append(pa.field(heading, arrow_type, nullable=field.null))
+    return pa.schema(fields)
+
+
+def generate_arrow(queryset, chunk_size=2000, buffer_size=64 * 1024):
+    return _generate_with_arrow_writer(
+        queryset, pa.ipc.new_stream, chunk_size, buffer_size
+    )
+
+
+def generate_parquet(queryset, chunk_size=2000, buffer_size=64 * 1024):
+    return _generate_with_arrow_writer(
+        queryset, pq.ParquetWriter, chunk_size, buffer_size
+    )
+
+
+def _generate_with_arrow_writer(queryset, open_writer, chunk_size, buffer_size):
+    schema = get_arrow_schema()
+    sink = _Sink()
+    writer = open_writer(pa.PythonFile(sink, mode="w"), schema)
+    rows = queryset.values_list(*CSV_FIELDS).iterator(chunk_size=chunk_size)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == ARROW_BATCH_SIZE:
+            writer.write_table(_get_arrow_table(batch, schema))
+            batch = []
+            if sink.size >= buffer_size:
+                yield sink.drain()
+    if batch:
+        writer.write_table(_get_arrow_table(batch, schema))
+    writer.close()
+    yield sink.drain()
+
+
+def _get_arrow_table(rows, schema):
+    columns = [
+        pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class _Sink:
+    """A write-only file that keeps what is written to it until it's drained.
+
+    Unlike a BytesIO that is emptied, its position keeps growing, as Parquet's
+    footer needs.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        result = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return result
+
+
+def get_download_filename(format_name):
+    return f"fmcsacensuscrunch.{FORMATS[format_name].extension}"
+
+
+ExportFormat = namedtuple(
+    "ExportFormat", ["label", "content_type", "extension", "generate"]
+)
+
+FORMATS = OrderedDict(
+    (
+        ("csv", ExportFormat("CSV", "text/csv", "csv", generate_csv)),
+        (
+            "csv.gz",
+            ExportFormat("gzipped CSV", "application/gzip", "csv.gz", generate_csv_gz),
+        ),
+        (
+            "jsonl",
+            ExportFormat("JSON Lines", "application/x-ndjson", "jsonl", generate_jsonl),
+        ),
+    )
+)
+if pa is not None:
+    FORMATS["parquet"] = ExportFormat(
+        "Parquet", "application/vnd.apache.parquet", "parquet", generate_parquet
+    )
+    FORMATS["arrow"] = ExportFormat(
+        "Arrow", "application/vnd.apache.arrow.stream", "arrows", generate_arrow
+    )
@@ -0,0 +1,181 @@
+"""Exporting search results in the background.
+
+A search that returns more than CENSUSCRUNCH_ROW_LIMIT rows can't be downloaded
+right away, so its export becomes an ExportJob. A pool of
+CENSUSCRUNCH_EXPORT_WORKERS worker processes writes the file to
+CENSUSCRUNCH_EXPORTS_DIR, streamed like the direct downloads, while the user
+polls the job's page, which links to the file when it's done.
+
+A job's key identifies the search, the format and the data generation, and it's
+unique in the database, so identical requests share a job, even if they are
+concurrent or in different processes, and its file serves them until the next
+import. (Before the first import, there's no data generation, and each request
+gets a job of its own.) The finished jobs of earlier generations, and their
+files, are removed when a job is created. A failed job is retried when it's
+requested again.
+
+The pool belongs to the process that created the job (e.g. a gunicorn worker),
+so a job that was waiting or running when that process stopped would stay so. A
+running job's heartbeat is therefore refreshed every HEARTBEAT_INTERVAL, and a
+job that has been waiting or running without a heartbeat for STALE_AFTER is
+retried like a failed one. (If the first run is in fact alive, both write the
+same file.)
+"""
+
+import datetime as dt
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from . import export
+from .counting import get_cache_key
+from .models import DataGeneration, ExportJob
+
+HEARTBEAT_INTERVAL = dt.timedelta(seconds=30)
+STALE_AFTER = dt.timedelta(minutes=10)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_export_job(filters, sort_order, format_name="csv"):
+    """Return the job that exports a search, creating and starting it if needed.
+
+    filters and sort_order are what SearchView has recorded in its "filters"
+    attribute and what its _get_sort_order() returns; format_name is one of
+    export.FORMATS.
+    """
+    query = QueryDict(mutable=True)
+    query.update(filters)
+    query.setlist("sort", sort_order)
+    search = {"filters": filters, "sort": sort_order, "format": format_name}
+    key = get_cache_key("export", search)
+    defaults = {
+        "generation": DataGeneration.current(),
+        "query_string": query.urlencode(),
+        "format": format_name,
+        "heartbeat": timezone.now(),
+    }
+    if key is None:
+        # Before the first import, there's no generation to tell whether a job
+        # is still valid, so jobs aren't shared.
+        job, start = ExportJob.objects.create(**defaults), True
+    else:
+        job, start = ExportJob.objects.get_or_create(key=key, defaults=defaults)
+    if start:
+        _remove_old_jobs(job.generation)
+    else:
+        # Retry a failed or stale job; the update makes sure that only one
+        # request does
+        now = timezone.now()
+        stale = Q(status__in=(ExportJob.PENDING, ExportJob.RUNNING)) & (
+            Q(heartbeat__lt=now - STALE_AFTER) | Q(heartbeat=None)
+        )
+        start = (
+            ExportJob.objects.filter(id=job.id)
+            .filter(Q(status=ExportJob.FAILED) | stale)
+            .update(status=ExportJob.PENDING, error="", finished=None, heartbeat=now)
+        )
+    if start:
+        submit(job.id)
+        job.refresh_from_db()
+    return job
+
+
+def _remove_old_jobs(generation):
+    old_jobs = ExportJob.objects.exclude(generation=generation).filter(
+        status__in=(ExportJob.DONE, ExportJob.FAILED)
+    )
+    for job in old_jobs:
+        try:
+            os.remove(job.filename)
+        except FileNotFoundError:
+            pass
+        job.delete()
+
+
+def submit(job_id):
+    """Run the job in the pool, or right away if there are no workers."""
+    global _executor
+    workers = settings.CENSUSCRUNCH_EXPORT_WORKERS
+    if not workers:
+        run_job(job_id)
+        return
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked, so that the workers don't share the
+            # database connections of the web process.
+            _executor = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        _executor.submit(_run_job_in_worker, job_id)
+
+
+def _run_job_in_worker(job_id):
+    # The workers are long-lived, so the database may have dropped a connection
+    close_old_connections()
+    run_job(job_id)
+
+
+def run_job(job_id):
+    """Write the file of a pending job, and record the outcome."""
+    jobs = ExportJob.objects.filter(id=job_id)
+    if not jobs.filter(status=ExportJob.PENDING).update(
+        status=ExportJob.RUNNING, heartbeat=timezone.now()
+    ):
+        return  # Deleted, or taken by another worker
+    job = jobs.get()
+    # Per process, in case a run that was taken for stale is still going
+    tmp_filename = f"{job.filename}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(settings.CENSUSCRUNCH_EXPORTS_DIR, exist_ok=True)
+        with open(tmp_filename, "wb") as f:
+            generate = export.FORMATS[job.format].generate
+            heartbeat_interval = HEARTBEAT_INTERVAL.total_seconds()
+            last_heartbeat = time.monotonic()
+            for chunk in generate(get_queryset(job.query_string)):
+                f.write(chunk)
+                if time.monotonic() - last_heartbeat >= heartbeat_interval:
+                    jobs.update(heartbeat=timezone.now())
+                    last_heartbeat = time.monotonic()
+        os.replace(tmp_filename, job.filename)
+    except Exception:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        jobs.update(
+            status=ExportJob.FAILED,
+            error=traceback.format_exc(),
+            finished=timezone.now(),
+        )
+    else:
+        jobs.update(
+            status=ExportJob.DONE,
+            size=os.path.getsize(job.filename),
+            finished=timezone.now(),
+        )
+
+
+def get_queryset(query_string):
+    """Return the carriers that the search page finds for query_string."""
+    from .views import SearchView  # The views import this module
+
+    request = HttpRequest()
+    # Like the request that created the job; without any parameters, the view
+    # wouldn't search at all.
+    request.GET = QueryDict(query_string, mutable=True)
+    request.GET["format"] = "csv"
+    view = SearchView()
+    view.setup(request)
+    return view._get_database_queryset()
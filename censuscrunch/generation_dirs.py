@@ -0,0 +1,34 @@
+"""Directories of files derived from a data generation.
+
+The columnar engine's columns and the prebuilt exports are written at import
+time to a subdirectory of a root directory named after the data generation, so
+that processes still using the files of the previous generation aren't
+affected. The files are written to "<generation>.tmp" and the directory is
+renamed when they are complete, so a directory named after a generation is
+always complete.
+"""
+
+import os
+import shutil
+
+
+def build_generation_directory(root, generation, write_files):
+    """Write the directory of a data generation with write_files(directory).
+
+    The directories of other generations are removed. If write_files() raises
+    an exception, nothing is left behind, and the other generations are kept.
+    """
+    directory = os.path.join(root, str(generation))
+    tmp_directory = directory + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    try:
+        write_files(tmp_directory)
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp_directory, directory)
+    for name in os.listdir(root):
+        if name != str(generation) and name.split(".")[0].isdigit():
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,99 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpRequest, QueryDict
+
+from censuscrunch.counting import get_count_queryset
+from censuscrunch.views import SearchView
+
+# Query strings of typical searches; most filter by state.
+DEFAULT_SEARCHES = (
+    "state=NY",
+    "state=NY&sort=name",
+    "state=TX&sort=-number_of_power_units",
+    "state=CA&min_number_of_power_units=10&max_number_of_power_units=20",
+    "state=CA&sort=number_of_drivers",
+    "min_number_of_power_units=500",
+    "sort=name",
+    "sort=-name",
+    "q=TRANSPORT",
+    "q=TRANSPORT&state=TX&sort=name",
+)
+
+SEQUENTIAL_SCAN_PATTERNS = {
+    "postgresql": re.compile(r"\bSeq Scan on\b"),
+    # "SCAN table" without "USING INDEX"; "TABLE" is there before SQLite 3.36.
+    "sqlite": re.compile(r"\bSCAN (TABLE )?\S+( AS \S+)?$"),
+}
+
+
+def get_search_querysets(query_string):
+    """Return the querysets SearchView runs for a search.
+
+    The result is a list of (description, queryset) pairs: the first page of
+    results, and the count of results. A search without filters counts the
+    first rows of the table, for which a sequential scan is the right plan, so
+    its count is left out.
+    """
+    request = HttpRequest()
+    request.GET = QueryDict(query_string)
+    view = SearchView()
+    view.setup(request)
+    # The database's queries, even if the columnar engine would run the search
+    queryset = view._get_database_queryset()
+    page_size = view.get_paginate_by(queryset)
+    result = [("page", queryset[:page_size])]
+    if view.filters:
+        limit = settings.CENSUSCRUNCH_ROW_LIMIT
+        result.append(("count", get_count_queryset(queryset, limit)))
+    return result
+
+
+def find_sequential_scans(plan):
+    """Return the lines of the EXPLAIN output that are sequential scans."""
+    pattern = SEQUENTIAL_SCAN_PATTERNS[connection.vendor]
+    return [line for line in plan.splitlines() if pattern.search(line)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on the queries of representative searches and fails if any "
+        "of them uses a sequential scan"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "searches",
+            nargs="*",
+            metavar="query_string",
+            help=(
+                "The searches to check, as query strings such as "
+                '"state=NY&sort=name" (default: a built-in set of typical searches)'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQUENTIAL_SCAN_PATTERNS:
+            raise CommandError(
+                "Query plans can only be checked on PostgreSQL and SQLite."
+            )
+        searches = options["searches"] or DEFAULT_SEARCHES
+        failures = total = 0
+        for query_string in searches:
+            for description, queryset in get_search_querysets(query_string):
+                total += 1
+                plan = queryset.explain()
+                scans = find_sequential_scans(plan)
+                failures += bool(scans)
+                status = "SEQ SCAN" if scans else "ok"
+                self.stdout.write(f"{status:<8} {description:<5} {query_string}")
+                if options["verbosity"] >= 2:
+                    for line in plan.splitlines():
+                        self.stdout.write(f"    {line}")
+        if failures:
+            raise CommandError(
+                f"{failures} of {total} queries use a sequential scan. Note that "
+                "the planner prefers sequential scans on small or unanalyzed tables."
+            )
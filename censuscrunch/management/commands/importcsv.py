@@ -1,12 +1,32 @@
+import bz2
+import cProfile
 import csv
 import datetime as dt
-from collections import OrderedDict, namedtuple
+import functools
+import gzip
+import hashlib
+import json
+import locale
+import lzma
+import os
+import sys
+import time
+import zipfile
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO, StringIO, TextIOWrapper
 
+import django
+from django.apps.registry import Apps
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connection, models, transaction
 from django.db.utils import DataError, IntegrityError
 
-from censuscrunch.models import Carrier
+from censuscrunch import columnar, prebuilt_exports
+from censuscrunch.models import Carrier, DataGeneration, ImportCheckpoint
+from censuscrunch.name_search import create_name_index, drop_name_index
 
 CarrierAttribute = namedtuple("CarrierAttribute", ["name", "conversion_function"])
 
@@ -17,7 +37,10 @@ def str2bool(s):
     return s == "Y"
 
 
+@functools.lru_cache(maxsize=None)
 def str2date(s):
+    # The file has 1.7 million rows but only a few thousand distinct dates, and
+    # strptime() is slow, so we memoize.
     if s:
         return dt.datetime.strptime(s, "%d-%b-%y").date()
     else:
@@ -31,24 +54,30 @@ def str2int(s):
         return None
 
 
+def str2code(s):
+    # The codes of choice fields (states, countries, carrier operations) are
+    # stored normalised, so that searches can compare them exactly.
+    return s.strip().upper()
+
+
 CARRIER_ATTRIBUTES = OrderedDict(
     (
-        ("DOT_NUMBER", CarrierAttribute("dot_number", str)),
+        ("DOT_NUMBER", CarrierAttribute("dot_number", int)),
         ("LEGAL_NAME", CarrierAttribute("legal_name", str)),
         ("DBA_NAME", CarrierAttribute("dba_name", str)),
-        ("CARRIER_OPERATION", CarrierAttribute("carrier_operation", str)),
+        ("CARRIER_OPERATION", CarrierAttribute("carrier_operation", str2code)),
         ("HM_FLAG", CarrierAttribute("hm", str2bool)),
         ("PC_FLAG", CarrierAttribute("pc", str2bool)),
         ("PHY_STREET", CarrierAttribute("physical_address", str)),
         ("PHY_CITY", CarrierAttribute("physical_city", str)),
-        ("PHY_STATE", CarrierAttribute("physical_state", str)),
+        ("PHY_STATE", CarrierAttribute("physical_state", str2code)),
         ("PHY_ZIP", CarrierAttribute("physical_zip", str)),
-        ("PHY_COUNTRY", CarrierAttribute("physical_country", str)),
+        ("PHY_COUNTRY", CarrierAttribute("physical_country", str2code)),
         ("MAILING_STREET", CarrierAttribute("mailing_address", str)),
         ("MAILING_CITY", CarrierAttribute("mailing_city", str)),
-        ("MAILING_STATE", CarrierAttribute("mailing_state", str)),
+        ("MAILING_STATE", CarrierAttribute("mailing_state", str2code)),
         ("MAILING_ZIP", CarrierAttribute("mailing_zip", str)),
-        ("MAILING_COUNTRY", CarrierAttribute("mailing_country", str)),
+        ("MAILING_COUNTRY", CarrierAttribute("mailing_country", str2code)),
         ("TELEPHONE", CarrierAttribute("tel", str)),
         ("FAX", CarrierAttribute("fax", str)),
         ("EMAIL_ADDRESS", CarrierAttribute("email", str)),
@@ -56,61 +85,1033 @@ CARRIER_ATTRIBUTES = OrderedDict(
         ("MCS150_MILEAGE", CarrierAttribute("mcs150_mileage", str2int)),
         ("MCS150_MILEAGE_YEAR", CarrierAttribute("mcs150_mileage_year", str2int)),
         ("ADD_DATE", CarrierAttribute("date_added_mcmis", str2date)),
-        ("OIC_STATE", CarrierAttribute("oic_state", str)),
+        ("OIC_STATE", CarrierAttribute("oic_state", str2code)),
         ("NBR_POWER_UNIT", CarrierAttribute("number_of_power_units", str2int)),
         ("DRIVER_TOTAL", CarrierAttribute("number_of_drivers", str2int)),
     )
 )
 
 
+# The converted row is followed by the carrier's name (see Carrier.name) and the
+# content hash.
+FIELD_NAMES = [attr.name for attr in CARRIER_ATTRIBUTES.values()] + [
+    "name",
+    "content_hash",
+]
+
+
+def get_content_hash(row):
+    digest = hashlib.blake2b("\x1f".join(row).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+CONVERSION_FUNCTIONS = tuple(
+    attr.conversion_function for attr in CARRIER_ATTRIBUTES.values()
+)
+
+
+def convert_row(row):
+    if len(row) != len(CONVERSION_FUNCTIONS):
+        raise ValueError(f"expected {len(CONVERSION_FUNCTIONS)} fields, got {len(row)}")
+    result = [convert(value) for convert, value in zip(CONVERSION_FUNCTIONS, row)]
+    result.append(result[2] or result[1])  # dba_name or legal_name
+    result.append(get_content_hash(row))
+    return result
+
+
+COMPRESSED_FILE_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def is_plain_file(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return filename != "-" and extension not in (".zip", *COMPRESSED_FILE_OPENERS)
+
+
+class LineReader:
+    """Iterates over the lines of a binary file as strings.
+
+    Unlike a text file, it keeps track of the byte offset it has reached, which
+    is where the next record starts.
+    """
+
+    def __init__(self, f, offset=0):
+        self.f = f
+        self.offset = offset
+        self.encoding = locale.getpreferredencoding(False)
+
+    def __iter__(self):
+        for line in self.f:
+            self.offset += len(line)
+            yield line.decode(self.encoding)
+
+    def seek(self, offset):
+        self.f.seek(offset)
+        self.offset = offset
+
+
+@contextmanager
+def open_input(filename):
+    """Open the file, decompressing it on the fly if needed, for reading lines.
+
+    The filename can also be "-" for standard input. A zip file must contain a
+    single CSV file. A plain file is returned as a LineReader, other inputs as
+    text streams.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if filename == "-":
+        yield sys.stdin
+    elif extension == ".zip":
+        with zipfile.ZipFile(filename) as zip_file:
+            with zip_file.open(get_zip_member(zip_file)) as f:
+                yield TextIOWrapper(f)
+    elif extension in COMPRESSED_FILE_OPENERS:
+        with COMPRESSED_FILE_OPENERS[extension](filename, "rt") as f:
+            yield f
+    else:
+        with open(filename, "rb") as f:
+            yield LineReader(f)
+
+
+def get_zip_member(zip_file):
+    names = zip_file.namelist()
+    if len(names) != 1:
+        names = [name for name in names if name.lower().endswith(".csv")]
+    if len(names) != 1:
+        raise CommandError("The zip file must contain exactly one CSV file.")
+    return names[0]
+
+
+def get_fingerprint(filename):
+    """Return a string that changes if the file is replaced by a different one."""
+    size = os.path.getsize(filename)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as f:
+        digest.update(f.read(65536))
+        f.seek(max(size - 65536, 0))
+        digest.update(f.read())
+    return f"{size}-{digest.hexdigest()}"
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def get_chunks(f, chunk_size):
+    """Split the rest of binary file f into (start, end) byte ranges.
+
+    Each range ends at a line boundary. This assumes that records don't contain
+    newlines, which is the case with FMCSA's file.
+    """
+    start = f.tell()
+    size = os.fstat(f.fileno()).st_size
+    while start < size:
+        f.seek(start + chunk_size - 1)
+        f.readline()
+        end = min(f.tell(), size)
+        yield start, end
+        start = end
+
+
+def convert_chunk(filename, start, end):
+    """Parse and convert the records between byte offsets start and end.
+
+    This runs in a worker process. It returns the converted rows, the byte
+    offsets at which they end, and an (index in the chunk, row, error message)
+    tuple for each row that could not be converted; in the list of converted
+    rows, such rows are None.
+    """
+    with open(filename, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return convert_lines(LineReader(BytesIO(data), start))
+
+
+def convert_lines(lines):
+    """Like convert_chunk(), but for lines already read from the file.
+
+    The result also includes the byte offset at which each record ends, if
+    lines is a LineReader, or a list of Nones otherwise.
+    """
+    rows = []
+    offsets = []
+    errors = []
+    for n, row in enumerate(csv.reader(lines)):
+        try:
+            rows.append(convert_row(row))
+        except ValueError as e:
+            rows.append(None)
+            errors.append((n, row, str(e)))
+        offsets.append(getattr(lines, "offset", None))
+    return rows, offsets, errors
+
+
+def format_value(value):
+    """Format a converted value the way it appears in the CSV file."""
+    if value is True or value is False:
+        return "NY"[value]
+    elif isinstance(value, dt.date):
+        return value.strftime("%d-%b-%y").upper()
+    elif value is None:
+        return ""
+    else:
+        return str(value)
+
+
+def format_row(values):
+    """Reverse convert_row() (except for the name and content hash it appends)."""
+    return [format_value(value) for value in values[: len(CARRIER_ATTRIBUTES)]]
+
+
+class OrmWriter:
+    def __init__(self, model):
+        self.model = model
+
+    def write(self, rows):
+        objs = (self.model(**dict(zip(FIELD_NAMES, values))) for values in rows)
+        self.model.objects.bulk_create(objs)
+
+
+class CopyWriter:
+    """Writes rows to the carrier table using PostgreSQL's COPY ... FROM STDIN."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def write(self, rows):
+        with connection.cursor() as cursor, connection.wrap_database_errors:
+            cursor.copy_expert(self.sql, CopyStream(rows))
+
+    @property
+    def sql(self):
+        meta = self.model._meta
+        fields = [meta.get_field(name) for name in FIELD_NAMES]
+        columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+        nullable_columns = ", ".join(
+            connection.ops.quote_name(f.column) for f in fields if f.null
+        )
+        table = connection.ops.quote_name(meta.db_table)
+        return (
+            f"COPY {table} ({columns}) FROM STDIN "
+            f"WITH (FORMAT csv, FORCE_NULL ({nullable_columns}))"
+        )
+
+
+class CopyStream:
+    """File-like object that renders rows as CSV as they are read.
+
+    copy_expert() pulls the data by calling read() repeatedly, so the rows are
+    converted to CSV a chunk at a time instead of all at once. The csv module
+    writes None as an empty quoted string; FORCE_NULL in the COPY statement
+    turns it back to NULL in the nullable columns.
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = StringIO()
+        self.csvwriter = csv.writer(self.buffer, quoting=csv.QUOTE_NONNUMERIC)
+
+    def read(self, size=-1):
+        while size < 0 or self.buffer.tell() < size:
+            try:
+                self.csvwriter.writerow(next(self.rows))
+            except StopIteration:
+                break
+        result = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return result
+
+
+class Differ:
+    """Compares imported rows with the carriers already in the database.
+
+    It keeps the content hash of every existing carrier in memory; a carrier is
+    removed from there once its row has been committed, so whatever remains at
+    the end is what has disappeared from the file.
+    """
+
+    MISSING = object()
+
+    def __init__(self):
+        self.hashes = dict(Carrier.objects.values_list("dot_number", "content_hash"))
+        self.inserted = 0
+        self.updated = 0
+
+    def split(self, batch):
+        new, changed = [], []
+        for i, values in batch:
+            old_hash = self.hashes.get(values[0], self.MISSING)
+            if old_hash is self.MISSING:
+                new.append((i, values))
+            elif old_hash != values[-1]:
+                changed.append((i, values))
+        return new, changed
+
+    def update(self, rows):
+        # Only a few percent of the carriers change between snapshots, so one
+        # UPDATE per changed carrier is fine.
+        for values in rows:
+            kwargs = dict(zip(FIELD_NAMES, values))
+            Carrier.objects.filter(dot_number=values[0]).update(**kwargs)
+
+    def keep(self, dot_number):
+        # For carriers whose row was rejected; they are left as they are.
+        self.hashes.pop(dot_number, None)
+
+    def forget(self, batch):
+        for i, values in batch:
+            old_hash = self.hashes.pop(values[0], self.MISSING)
+            if old_hash is self.MISSING:
+                self.inserted += 1
+            elif old_hash != values[-1]:
+                self.updated += 1
+
+    def delete_missing(self):
+        result = len(self.hashes)
+        dot_numbers = list(self.hashes)
+        while dot_numbers:
+            chunk, dot_numbers = dot_numbers[:500], dot_numbers[500:]
+            Carrier.objects.filter(dot_number__in=chunk).delete()
+        self.hashes = {}
+        return result
+
+
+def get_index_names(model):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        )
+    return {name for name, constraint in constraints.items() if constraint["index"]}
+
+
+def drop_indexes(model, indexes):
+    existing_index_names = get_index_names(model)
+    with connection.schema_editor() as schema_editor:
+        for index in indexes:
+            if index.name in existing_index_names:
+                schema_editor.remove_index(model, index)
+
+
+def build_indexes(model, indexes):
+    """Create the indexes that don't exist and return how long each one took.
+
+    On PostgreSQL the indexes are built concurrently, each in its own thread and
+    database connection. The result is a list of (index name, seconds) tuples.
+    """
+    existing_index_names = get_index_names(model)
+    indexes = [index for index in indexes if index.name not in existing_index_names]
+    if connection.vendor == "postgresql" and len(indexes) > 1:
+        with ThreadPoolExecutor(len(indexes)) as executor:
+            futures = [
+                executor.submit(_build_index_in_thread, model, index)
+                for index in indexes
+            ]
+            return [future.result() for future in futures]
+    else:
+        return [_build_index(model, index) for index in indexes]
+
+
+def _build_index(model, index):
+    start_time = time.monotonic()
+    with connection.schema_editor() as schema_editor:
+        schema_editor.add_index(model, index)
+    return index.name, time.monotonic() - start_time
+
+
+def drop_name_search_index():
+    with connection.schema_editor() as schema_editor:
+        drop_name_index(schema_editor)
+
+
+def build_name_search_index(table=Carrier._meta.db_table):
+    """Create the name search index; return its name and how long it took."""
+    start_time = time.monotonic()
+    with connection.schema_editor() as schema_editor:
+        create_name_index(schema_editor, table)
+    return "name search", time.monotonic() - start_time
+
+
+def _build_index_in_thread(model, index):
+    # Django connections are per thread, so this thread has its own connection,
+    # which we must close ourselves.
+    try:
+        return _build_index(model, index)
+    finally:
+        connection.close()
+
+
+class ShadowTable:
+    """A copy of the carrier table that is loaded and then swapped in its place.
+
+    The shadow table is created without the secondary indexes, which are built
+    after it has been loaded. The swap (dropping the carrier table and renaming
+    the shadow table and its indexes) happens in a single transaction, so readers
+    see either the old data or the new data. SQLite can't rename indexes, so
+    there they are built at the swap instead, still in the same transaction.
+    """
+
+    def __init__(self):
+        self.table = Carrier._meta.db_table
+        self.name = self.table + "_new"
+        self.model = self._create_model()
+
+    def _create_model(self):
+        attrs = {field.name: field.clone() for field in Carrier._meta.local_fields}
+        attrs["__module__"] = __name__
+        attrs["Meta"] = type(
+            "Meta",
+            (),
+            {
+                "apps": Apps(),
+                "app_label": Carrier._meta.app_label,
+                "db_table": self.name,
+            },
+        )
+        return type("ShadowCarrier", (models.Model,), attrs)
+
+    def create(self):
+        self.drop()
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(self.model)
+
+    def drop(self):
+        if self.name in connection.introspection.table_names():
+            with connection.schema_editor() as schema_editor:
+                schema_editor.delete_model(self.model)
+
+    def build_indexes(self):
+        if connection.vendor != "postgresql":
+            return []
+        indexes = [self._get_shadow_index(index) for index in Carrier._meta.indexes]
+        result = build_indexes(self.model, indexes)
+        result.append(build_name_search_index(self.name))
+        return result
+
+    def _get_shadow_index(self, index):
+        result = index.clone()
+        result.name = index.name + "_new"
+        return result
+
+    def swap(self):
+        with connection.schema_editor(atomic=True) as schema_editor:
+            drop_name_index(schema_editor)
+            schema_editor.delete_model(Carrier)
+            schema_editor.alter_db_table(self.model, self.name, self.table)
+            if connection.vendor == "postgresql":
+                self._rename_postgresql_indexes(schema_editor)
+            else:
+                for index in Carrier._meta.indexes:
+                    schema_editor.add_index(Carrier, index)
+                create_name_index(schema_editor)
+
+    def _rename_postgresql_indexes(self, schema_editor):
+        # Give the indexes, constraints and sequence of the table the names they'd
+        # have if it had been created by the migrations (as far as these names
+        # depend on the table name), so that the next shadow table doesn't clash.
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, self.table)
+            sequences = connection.introspection.get_sequences(cursor, self.table)
+        for index in Carrier._meta.indexes:
+            self._rename(schema_editor, "INDEX", index.name + "_new", index.name)
+        for name, constraint in constraints.items():
+            if name.startswith(self.name):
+                self._rename_constraint(schema_editor, name, constraint)
+        for sequence in sequences:
+            if sequence["name"].startswith(self.name):
+                new_name = sequence["name"].replace(self.name, self.table, 1)
+                self._rename(schema_editor, "SEQUENCE", sequence["name"], new_name)
+
+    def _rename_constraint(self, schema_editor, name, constraint):
+        new_name = name.replace(self.name, self.table, 1)
+        if constraint["check"] or constraint["foreign_key"]:
+            # These have no index. Renaming the index of a primary key or unique
+            # constraint renames the constraint too.
+            quote_name = schema_editor.quote_name
+            schema_editor.execute(
+                f"ALTER TABLE {quote_name(self.table)} RENAME CONSTRAINT "
+                f"{quote_name(name)} TO {quote_name(new_name)}"
+            )
+        else:
+            self._rename(schema_editor, "INDEX", name, new_name)
+
+    def _rename(self, schema_editor, kind, old_name, new_name):
+        quote_name = schema_editor.quote_name
+        schema_editor.execute(
+            f"ALTER {kind} {quote_name(old_name)} RENAME TO {quote_name(new_name)}"
+        )
+
+
+class ImportStats:
+    """Where the time of an import goes, and how fast it is progressing.
+
+    "seconds" holds the time spent in each stage. With several workers, reading
+    and converting happen in the worker processes, and "convert" is the time the
+    main process spends waiting for them.
+    """
+
+    STAGES = (
+        "delete",
+        "read",
+        "convert",
+        "write",
+        "commit",
+        "indexes",
+        "columns",
+        "exports",
+    )
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.records = 0
+        self.file_size = None
+        self.start_offset = 0
+        self.reading_start_time = self.start_time
+
+    def start_reading(self, file_size, offset):
+        self.file_size = file_size
+        self.start_offset = offset
+        self.reading_start_time = time.perf_counter()
+
+    @contextmanager
+    def timing(self, stage):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start_time
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.reading_start_time
+        return self.records / elapsed if elapsed else 0.0
+
+    def get_eta(self, offset):
+        """Estimate the seconds remaining, from the byte offset reached."""
+        if offset is None or not self.file_size or offset <= self.start_offset:
+            return None
+        elapsed = time.perf_counter() - self.reading_start_time
+        return elapsed * (self.file_size - offset) / (offset - self.start_offset)
+
+
 class Command(BaseCommand):
     help = "Discards database and imports FCMSA's CSV file"
 
     def add_arguments(self, parser):
         parser.add_argument("filename")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="Number of records to insert (and commit) at a time",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=["orm", "copy"],
+            default="orm",
+            help=(
+                'How to write the records; "copy" uses PostgreSQL\'s COPY and '
+                'falls back to "orm" on other databases'
+            ),
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Instead of replacing all records, insert new carriers, update "
+                "changed ones and delete those missing from the file"
+            ),
+        )
+        parser.add_argument(
+            "--shadow-table",
+            action="store_true",
+            help=(
+                "Load the records into a new table and swap it in place of the "
+                "existing one at the end, so that searches never see a partial "
+                "import"
+            ),
+        )
+        parser.add_argument(
+            "--defer-indexes",
+            action="store_true",
+            help=(
+                "Drop the secondary indexes before loading the records and build "
+                "them again afterwards"
+            ),
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help=(
+                "Record how far the import has got whenever it commits and, if a "
+                "previous import of the same file was interrupted, continue it"
+            ),
+        )
+        parser.add_argument(
+            "--max-errors",
+            type=int,
+            default=0,
+            help=(
+                "Skip up to this number of rows that can't be imported, instead of "
+                "stopping at the first one"
+            ),
+        )
+        parser.add_argument(
+            "--rejects",
+            help=(
+                "CSV file to which to write the skipped rows, preceded by their "
+                "line number and the error message"
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes that parse and convert the file",
+        )
+        parser.add_argument(
+            "--json-progress",
+            action="store_true",
+            help=(
+                "Write the progress, the index build times and the final "
+                "statistics as JSON lines to standard output"
+            ),
+        )
+        parser.add_argument(
+            "--profile",
+            metavar="FILENAME",
+            help=(
+                "Save cProfile statistics for the run (of the main process only) "
+                'to this file; view them with "python -m pstats FILENAME"'
+            ),
+        )
 
     def handle(self, *args, **options):
+        if not options["profile"]:
+            self._handle(options)
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self._handle(options)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(options["profile"])
+
+    def _handle(self, options):
+        self.stats = ImportStats()
+        self.json_progress = options["json_progress"]
         self.filename = options["filename"]
         self.verbosity = options["verbosity"]
-        self._delete_existing_records()
-        self._import_csv()
+        self.batch_size = options["batch_size"]
+        if self.batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+        self.workers = options["workers"]
+        if self.workers < 1:
+            raise CommandError("--workers must be a positive integer.")
+        if options["incremental"] and options["shadow_table"]:
+            raise CommandError("--incremental and --shadow-table are incompatible.")
+        self.resume = options["resume"]
+        self.checkpoint = None
+        if self.resume:
+            self._check_resume_options(options)
+            self.fingerprint = get_fingerprint(self.filename)
+            self.checkpoint = self._get_checkpoint()
+        self.max_errors = options["max_errors"]
+        self.rejects_filename = options["rejects"]
+        self.errors = 0
+        self.differ = None
+        self.deleted = 0
+        self.shadow_table = None
+        if options["incremental"]:
+            self.differ = Differ()
+        elif options["shadow_table"]:
+            self.shadow_table = ShadowTable()
+        self.writer = self._get_writer(options["engine"])
+        try:
+            with self._open_rejects_file():
+                self._import(options)
+        finally:
+            # Even a failed import may have committed some changes
+            DataGeneration.advance()
+        self._build_columns()
+        self._build_exports()
+        self._report_errors()
+        self._report_stats()
+
+    def _import(self, options):
+        if self.shadow_table:
+            # The shadow table's indexes are always built after it is loaded
+            self._import_csv_into_shadow_table()
+        elif options["defer_indexes"]:
+            drop_indexes(Carrier, Carrier._meta.indexes)
+            drop_name_search_index()
+            try:
+                self._import_csv_into_carrier_table()
+            finally:
+                with self.stats.timing("indexes"):
+                    index_build_times = build_indexes(Carrier, Carrier._meta.indexes)
+                    index_build_times.append(build_name_search_index())
+                self._report_index_build_times(index_build_times)
+        else:
+            self._import_csv_into_carrier_table()
+
+    @contextmanager
+    def _open_rejects_file(self):
+        self.rejects_writer = None
+        if not self.rejects_filename:
+            yield
+            return
+        # When resuming, the rows rejected before the checkpoint are already there,
+        # unless the interrupted import didn't write them to this file
+        mode = "a" if self.checkpoint else "w"
+        try:
+            with open(self.rejects_filename, mode, newline="") as f:
+                self.rejects_writer = csv.writer(f)
+                if f.tell() == 0:
+                    heading = ["LINE", "ERROR"] + list(CARRIER_ATTRIBUTES.keys())
+                    self.rejects_writer.writerow(heading)
+                yield
+        except OSError as e:
+            raise CommandError(str(e))
+
+    def _reject_row(self, i, row, message):
+        self.errors += 1
+        if self.errors > self.max_errors:
+            raise CommandError(f"Error in line {i}: {message}")
+        if self.rejects_writer:
+            self.rejects_writer.writerow([i, message] + row)
+        if self.differ:
+            try:
+                self.differ.keep(int(row[0]))
+            except (IndexError, ValueError):
+                pass
+
+    def _build_columns(self):
+        if not settings.CENSUSCRUNCH_COLUMNS_DIR:
+            return
+        if not columnar.is_enabled():
+            self.stderr.write(
+                "Not writing the search columns, because NumPy is not installed."
+            )
+            return
+        with self.stats.timing("columns"):
+            columnar.build_columns(DataGeneration.current())
+
+    def _build_exports(self):
+        if not settings.CENSUSCRUNCH_PREBUILT_EXPORTS_DIR:
+            return
+        with self.stats.timing("exports"):
+            try:
+                prebuilt_exports.build_exports(DataGeneration.current())
+            except UnicodeEncodeError as e:
+                # The data is imported; it's served without the exports
+                self.stderr.write(f"Not writing the prebuilt exports: {e}")
+
+    def _report_errors(self):
+        if self.json_progress:
+            return  # The count is in the "done" event
+        if self.verbosity >= 1 and (self.max_errors or self.rejects_filename):
+            self.stdout.write(f"{self.errors:,} rows rejected")
+
+    def _report_stats(self):
+        stats = self.stats
+        elapsed = stats.elapsed
+        rows_per_second = stats.records / elapsed if elapsed else 0.0
+        if self.json_progress:
+            if self.differ:
+                counts = {
+                    "inserted": self.differ.inserted,
+                    "updated": self.differ.updated,
+                    "deleted": self.deleted,
+                }
+            else:
+                counts = {}
+            self._write_json(
+                event="done",
+                records=stats.records,
+                rejected=self.errors,
+                elapsed=elapsed,
+                rows_per_second=rows_per_second,
+                seconds=stats.seconds,
+                **counts,
+            )
+        elif self.verbosity >= 2:
+            stages = ", ".join(f"{k} {v:.1f} s" for k, v in stats.seconds.items())
+            self.stdout.write(f"Time spent: {stages}")
+            self.stdout.write(
+                f"{stats.records:,} records in {elapsed:.1f} s "
+                f"({rows_per_second:,.0f} rows/s)"
+            )
+
+    def _write_json(self, **kwargs):
+        self.stdout.write(json.dumps(kwargs))
+
+    def _check_resume_options(self, options):
+        if options["incremental"] or options["shadow_table"]:
+            raise CommandError(
+                "--resume can't be used with --incremental or --shadow-table."
+            )
+        if not is_plain_file(self.filename):
+            raise CommandError("--resume needs an uncompressed file.")
+
+    def _get_checkpoint(self):
+        try:
+            return ImportCheckpoint.objects.get(
+                filename=os.path.abspath(self.filename), fingerprint=self.fingerprint
+            )
+        except ImportCheckpoint.DoesNotExist:
+            return None
+
+    def _save_checkpoint(self, line_number):
+        ImportCheckpoint.objects.update_or_create(
+            id=1,
+            defaults={
+                "filename": os.path.abspath(self.filename),
+                "fingerprint": self.fingerprint,
+                "offset": self.offset,
+                "line_number": line_number,
+            },
+        )
+
+    def _import_csv_into_carrier_table(self):
+        if self.differ:
+            # The checkpoints are of imports into a table that this one modifies
+            ImportCheckpoint.objects.all().delete()
+            self._import_csv()
+            self._delete_missing_records()
+        elif self.checkpoint:
+            if self.verbosity >= 1:
+                self.stderr.write(f"Resuming after line {self.checkpoint.line_number}")
+            self._import_csv()
+        else:
+            self._delete_existing_records()
+            self._import_csv()
+        if self.resume:
+            ImportCheckpoint.objects.all().delete()
+
+    def _report_index_build_times(self, index_build_times):
+        for name, seconds in index_build_times:
+            if self.json_progress:
+                self._write_json(event="index_built", name=name, seconds=seconds)
+            elif self.verbosity >= 1:
+                self.stdout.write(f"Built index {name} in {seconds:.1f} s")
+
+    def _get_writer(self, engine):
+        model = self.shadow_table.model if self.shadow_table else Carrier
+        if engine == "copy" and connection.vendor == "postgresql":
+            return CopyWriter(model)
+        elif engine == "copy" and self.verbosity >= 1:
+            self.stderr.write(
+                f"COPY is not supported by {connection.vendor}; using the ORM instead"
+            )
+        return OrmWriter(model)
+
+    def _import_csv_into_shadow_table(self):
+        ImportCheckpoint.objects.all().delete()
+        self.shadow_table.create()
+        try:
+            self._import_csv()
+            with self.stats.timing("indexes"):
+                index_build_times = self.shadow_table.build_indexes()
+            self._report_index_build_times(index_build_times)
+        except BaseException:
+            self.shadow_table.drop()
+            raise
+        self.shadow_table.swap()
 
     def _delete_existing_records(self):
-        Carrier.objects.all().delete()
+        with self.stats.timing("delete"):
+            Carrier.objects.all().delete()
+        ImportCheckpoint.objects.all().delete()
 
     def _import_csv(self):
         try:
-            with open(self.filename) as f:
+            with open_input(self.filename) as f:
                 csvreader = csv.reader(f)
-                self._read_csv(csvreader)
-        except OSError as e:
+                self._read_csv_heading(csvreader)
+                if self.checkpoint:
+                    f.seek(self.checkpoint.offset)
+                self.offset = getattr(f, "offset", None)
+                file_size = (
+                    None if self.offset is None else os.path.getsize(self.filename)
+                )
+                self.stats.start_reading(file_size, self.offset)
+                if self.workers > 1:
+                    records = self._convert_csv_records_in_parallel(f)
+                else:
+                    records = self._convert_csv_records(csvreader, f)
+                self._read_csv_body(records)
+        except (OSError, EOFError, zipfile.BadZipFile, lzma.LZMAError) as e:
             raise CommandError(str(e))
 
-    def _read_csv(self, csvreader):
-        self._read_csv_heading(csvreader)
-        self._read_csv_body(csvreader)
-
     def _read_csv_heading(self, csvreader):
         if next(csvreader) != list(CARRIER_ATTRIBUTES.keys()):
             raise CommandError("The file does not have the expected heading.")
 
-    def _read_csv_body(self, csvreader):
-        transaction.set_autocommit(False)
-        for i, row in enumerate(csvreader, start=2):
+    @property
+    def first_line_number(self):
+        return self.checkpoint.line_number + 1 if self.checkpoint else 2
+
+    def _convert_csv_records(self, csvreader, f):
+        # self.offset is the byte offset where the latest record yielded ends; it
+        # is None if the input is not a plain file. This runs once per row, so the
+        # stage times are added up by hand rather than with stats.timing().
+        seconds = self.stats.seconds
+        clock = time.perf_counter
+        read_start_time = clock()
+        for i, row in enumerate(csvreader, start=self.first_line_number):
+            convert_start_time = clock()
+            seconds["read"] += convert_start_time - read_start_time
             try:
-                self._create_carrier(row)
-            except (ValueError, IntegrityError, DataError) as e:
-                raise CommandError(f"Error in line {i}: {str(e)}")
+                values = convert_row(row)
+            except ValueError as e:
+                self._reject_row(i, row, str(e))
+                read_start_time = clock()
+                continue
+            seconds["convert"] += clock() - convert_start_time
+            self.offset = getattr(f, "offset", None)
+            yield i, values
+            read_start_time = clock()
+
+    def _convert_csv_records_in_parallel(self, f):
+        i = self.first_line_number
+        for rows, offsets, errors in self._timed(self._convert_chunks(f), "convert"):
+            errors = {n: (row, message) for n, row, message in errors}
+            for n, values in enumerate(rows):
+                if values is None:
+                    self._reject_row(i, *errors[n])
+                else:
+                    self.offset = offsets[n]
+                    yield i, values
+                i += 1
+
+    def _timed(self, iterable, stage):
+        # Like iterable, but adds the time spent waiting for each item to the stage
+        iterator = iter(iterable)
+        while True:
+            with self.stats.timing(stage):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def _convert_chunks(self, f):
+        # Chunks are submitted only a little ahead of the writer, so that converted
+        # rows don't pile up in memory if the database is slower than the workers.
+        # The initializer is needed where workers are spawned rather than forked.
+        futures = deque()
+        with ProcessPoolExecutor(self.workers, initializer=django.setup) as executor:
+            for task in self._get_chunk_tasks(f):
+                futures.append(executor.submit(*task))
+                if len(futures) > 2 * self.workers:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+    def _get_chunk_tasks(self, f):
+        # Workers read plain files themselves; compressed files and standard input
+        # can only be read sequentially, so we read them and pass on the lines.
+        if is_plain_file(self.filename):
+            with open(self.filename, "rb") as binary_file:
+                binary_file.seek(f.offset)
+                for start, end in get_chunks(binary_file, CHUNK_SIZE):
+                    yield convert_chunk, self.filename, start, end
+        else:
+            lines = f.readlines(CHUNK_SIZE)
+            while lines:
+                yield convert_lines, lines
+                lines = f.readlines(CHUNK_SIZE)
+
+    def _read_csv_body(self, records):
+        transaction.set_autocommit(False)
+        try:
+            self._write_records(records)
+        except Exception:
+            transaction.rollback()
+            raise
+        finally:
+            transaction.set_autocommit(True)
+
+    def _write_records(self, records):
+        batch = []
+        for i, values in records:
+            self.stats.records += 1
+            batch.append((i, values))
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
             self._show_progress(i)
-            if ((i // 10_000) * 10_000) == i:
-                transaction.commit()
-        transaction.commit()
+        self._write_batch(batch)
 
     def _show_progress(self, i):
-        if self.verbosity >= 1 and ((i // 10_000) * 10_000 == i):
-            self.stderr.write(f"\r{i:,} records completed")
+        if (i // 10_000) * 10_000 != i:
+            return
+        eta = self.stats.get_eta(self.offset)
+        if self.json_progress:
+            self._write_json(
+                event="progress",
+                line=i,
+                records=self.stats.records,
+                elapsed=self.stats.elapsed,
+                rows_per_second=self.stats.rows_per_second,
+                offset=self.offset,
+                size=self.stats.file_size,
+                eta=eta,
+            )
+        elif self.verbosity >= 1:
+            eta = "" if eta is None else f", {dt.timedelta(seconds=round(eta))} left"
+            self.stderr.write(
+                f"\r{i:,} records completed, "
+                f"{self.stats.rows_per_second:,.0f} rows/s{eta}"
+            )
+
+    def _write_batch(self, batch):
+        # A multi-row insert that fails doesn't tell us which row was the culprit, so
+        # in that case we roll back (only the current batch is uncommitted) and retry
+        # the batch one row at a time in order to report the offending line.
+        last_line_number = batch[-1][0] if batch else None
+        with self.stats.timing("write"):
+            try:
+                self._store(batch)
+            except (IntegrityError, DataError):
+                transaction.rollback()
+                batch = self._store_row_by_row(batch)
+        with self.stats.timing("commit"):
+            if self.resume and last_line_number:
+                self._save_checkpoint(last_line_number)
+            transaction.commit()
+        if self.differ:
+            self.differ.forget(batch)
+
+    def _store_row_by_row(self, batch):
+        # Returns the rows that have been stored, i.e. the batch minus the rejects.
+        # Each row gets a savepoint so that a failed one can be rolled back alone.
+        result = []
+        for i, values in batch:
+            try:
+                with transaction.atomic():
+                    self._store([(i, values)])
+            except (IntegrityError, DataError) as e:
+                self._reject_row(i, format_row(values), str(e))
+            else:
+                result.append((i, values))
+        return result
+
+    def _store(self, batch):
+        if self.differ:
+            batch, changed = self.differ.split(batch)
+            self.differ.update(values for i, values in changed)
+        self.writer.write(values for i, values in batch)
 
-    def _create_carrier(self, row):
-        azip = zip(CARRIER_ATTRIBUTES.values(), row)
-        kwargs = {attr.name: attr.conversion_function(value) for attr, value in azip}
-        Carrier.objects.create(**kwargs)
+    def _delete_missing_records(self):
+        with self.stats.timing("delete"), transaction.atomic():
+            self.deleted = self.differ.delete_missing()
+        if self.verbosity >= 1 and not self.json_progress:
+            self.stdout.write(
+                f"{self.differ.inserted:,} inserted, {self.differ.updated:,} updated, "
+                f"{self.deleted:,} deleted"
+            )
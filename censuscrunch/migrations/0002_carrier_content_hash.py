@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("censuscrunch", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="carrier",
+            name="content_hash",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("censuscrunch", "0002_carrier_content_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("filename", models.CharField(max_length=255)),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("offset", models.BigIntegerField()),
+                ("line_number", models.PositiveIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from censuscrunch.name_search import create_name_index, drop_name_index
+
+
+def create(apps, schema_editor):
+    create_name_index(schema_editor)
+
+
+def drop(apps, schema_editor):
+    drop_name_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("censuscrunch", "0003_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.RunPython(create, drop),
+    ]
@@ -0,0 +1,95 @@
+from django.db import migrations, models
+from django.db.models import Case, F, When
+
+from censuscrunch.name_search import create_name_index, drop_name_index
+
+
+# On SQLite, adding a field recreates the table, which drops the triggers of the
+# name search index, so the index is dropped before and recreated after.
+def drop_sqlite_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        drop_name_index(schema_editor)
+
+
+def create_sqlite_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        create_name_index(schema_editor)
+
+
+def set_names(apps, schema_editor):
+    Carrier = apps.get_model("censuscrunch", "Carrier")
+    Carrier.objects.update(
+        name=Case(When(dba_name="", then=F("legal_name")), default=F("dba_name"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("censuscrunch", "0005_datageneration"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_name_index, create_sqlite_name_index),
+        migrations.RemoveIndex(
+            model_name="carrier", name="censuscrunc_number__437204_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="carrier", name="censuscrunc_number__b21ccd_idx",
+        ),
+        migrations.AddField(
+            model_name="carrier",
+            name="name",
+            field=models.CharField(default="", editable=False, max_length=150),
+        ),
+        migrations.RunPython(set_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(
+                fields=["number_of_power_units", "dot_number"],
+                name="censuscrunc_number__8a3ba1_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(
+                fields=["number_of_drivers", "dot_number"],
+                name="censuscrunc_number__4efcec_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(
+                fields=["name", "dot_number"], name="censuscrunc_name_c865a1_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(
+                fields=["physical_state", "dot_number"],
+                name="censuscrunc_physica_87c6f6_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(
+                fields=["physical_state", "name", "dot_number"],
+                name="censuscrunc_physica_16e0f6_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(
+                fields=["physical_state", "number_of_power_units", "dot_number"],
+                name="censuscrunc_physica_eaa51c_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(
+                fields=["physical_state", "number_of_drivers", "dot_number"],
+                name="censuscrunc_physica_31c4a5_idx",
+            ),
+        ),
+        migrations.RunPython(create_sqlite_name_index, drop_sqlite_name_index),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models.functions import Trim, Upper
+
+CODE_FIELDS = (
+    "carrier_operation",
+    "physical_state",
+    "physical_country",
+    "mailing_state",
+    "mailing_country",
+    "oic_state",
+)
+
+
+def normalise_codes(apps, schema_editor):
+    Carrier = apps.get_model("censuscrunch", "Carrier")
+    for field in CODE_FIELDS:
+        normalised = Upper(Trim(field))
+        Carrier.objects.exclude(**{field: normalised}).update(**{field: normalised})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("censuscrunch", "0006_carrier_name"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalise_codes, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,9 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
+from django.urls import reverse
 
 CARRIER_OPERATION_CHOICES = (
     ("A", "Interstate"),
@@ -96,22 +101,39 @@ class Carrier(models.Model):
     oic_state = models.CharField(max_length=2, choices=STATES)
     number_of_power_units = models.PositiveIntegerField(null=True, blank=True)
     number_of_drivers = models.PositiveIntegerField(null=True, blank=True)
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+    # What __str__() returns, stored so that sorting by name can use an index
+    name = models.CharField(max_length=150, editable=False, default="")
 
     class Meta:
+        # Search results are sorted by the requested column and then by
+        # dot_number, and most searches filter by state, so the sort indexes
+        # end with dot_number and also exist prefixed with physical_state.
         indexes = [
             models.Index(fields=["physical_state", "physical_zip", "physical_address"]),
             models.Index(fields=["mailing_state", "mailing_zip", "mailing_address"]),
             models.Index(fields=["mcs150_date"]),
             models.Index(fields=["date_added_mcmis"]),
             models.Index(fields=["oic_state"]),
-            models.Index(fields=["number_of_power_units"]),
-            models.Index(fields=["number_of_drivers"]),
+            models.Index(fields=["number_of_power_units", "dot_number"]),
+            models.Index(fields=["number_of_drivers", "dot_number"]),
+            models.Index(fields=["name", "dot_number"]),
+            models.Index(fields=["physical_state", "dot_number"]),
+            models.Index(fields=["physical_state", "name", "dot_number"]),
+            models.Index(
+                fields=["physical_state", "number_of_power_units", "dot_number"]
+            ),
+            models.Index(fields=["physical_state", "number_of_drivers", "dot_number"]),
         ]
         ordering = ("dot_number",)
 
     def __str__(self):
         return self.dba_name or self.legal_name
 
+    def save(self, *args, **kwargs):
+        self.name = str(self)
+        super().save(*args, **kwargs)
+
     @property
     def email_local_part(self):
         if "@" in self.email:
@@ -133,3 +155,80 @@ class Carrier(models.Model):
             return f'{self.email_local_part}@<a href="http://{domain}">{domain}</a>'
         else:
             return ""
+
+
+class ImportCheckpoint(models.Model):
+    """How far "importcsv --resume" has got in importing a file."""
+
+    filename = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    offset = models.BigIntegerField()
+    line_number = models.PositiveIntegerField()
+
+
+class DataGeneration(models.Model):
+    """A number that "importcsv" increases whenever it has changed the carriers.
+
+    Cached search results include it in their cache key, so they expire at the
+    next import. There is a single row, which doesn't exist until the first
+    import.
+    """
+
+    number = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        """Return the current number, or None if there hasn't been an import."""
+        return cls.objects.filter(id=1).values_list("number", flat=True).first()
+
+    @classmethod
+    def advance(cls):
+        if not cls.objects.filter(id=1).update(number=models.F("number") + 1):
+            cls.objects.create(id=1, number=1)
+
+
+class ExportJob(models.Model):
+    """An export of search results that are too many to download right away.
+
+    See censuscrunch.export_jobs. The key identifies the search, the format and
+    the data generation, so that identical requests share a job until the next
+    import.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Waiting"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    key = models.CharField(max_length=100, unique=True, null=True)
+    generation = models.PositiveIntegerField(null=True)
+    query_string = models.TextField()
+    # One of censuscrunch.export.FORMATS
+    format = models.CharField(max_length=10, default="csv")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    size = models.BigIntegerField(null=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # When the job was last known to be waiting or running in a live process
+    heartbeat = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    def get_absolute_url(self):
+        return reverse("export_job", args=[self.id])
+
+    @property
+    def filename(self):
+        return os.path.join(
+            settings.CENSUSCRUNCH_EXPORTS_DIR, f"{self.id}.{self.format}"
+        )
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
@@ -0,0 +1,133 @@
+"""Indexed substring search of carrier names.
+
+A search for carriers whose legal or DBA name contains a term can't use a
+B-tree index, so we maintain a dedicated index:
+
+* On PostgreSQL, a trigram GIN index (pg_trgm) on each name column. The
+  indexed expression is what Django's "icontains" compares, so the search is
+  an ordinary "icontains" filter that the planner answers from the indexes.
+
+* On SQLite, an FTS5 table with the trigram tokenizer whose content is the
+  carrier table; triggers keep it in sync. A term that is at least three
+  characters long is looked up there.
+
+Elsewhere, and for shorter terms, the search is a sequential scan. In all cases
+the result is the same as with "icontains" (apart from the case folding of
+non-ASCII characters on SQLite).
+"""
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Carrier
+
+NAME_FIELDS = ("legal_name", "dba_name")
+MIN_INDEXED_TERM_LENGTH = 3
+
+
+def get_fts_table(table=Carrier._meta.db_table):
+    return table + "_name"
+
+
+def create_name_index(schema_editor, table=Carrier._meta.db_table):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _create_trigram_indexes(schema_editor, table)
+    elif vendor == "sqlite" and _sqlite_supports_trigram_fts(schema_editor):
+        _create_fts_table(schema_editor, table)
+
+
+def drop_name_index(schema_editor, table=Carrier._meta.db_table):
+    quote_name = schema_editor.quote_name
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        for field in NAME_FIELDS:
+            index_name = quote_name(f"{table}_{field}_trgm")
+            schema_editor.execute(f"DROP INDEX IF EXISTS {index_name}")
+    elif vendor == "sqlite":
+        for trigger in ("insert", "delete", "update"):
+            trigger_name = quote_name(f"{get_fts_table(table)}_{trigger}")
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+        schema_editor.execute(
+            f"DROP TABLE IF EXISTS {quote_name(get_fts_table(table))}"
+        )
+
+
+def _create_trigram_indexes(schema_editor, table):
+    quote_name = schema_editor.quote_name
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for field in NAME_FIELDS:
+        schema_editor.execute(
+            f"CREATE INDEX {quote_name(f'{table}_{field}_trgm')} ON "
+            f"{quote_name(table)} USING gin "
+            f"(UPPER({quote_name(field)}::text) gin_trgm_ops)"
+        )
+
+
+def _sqlite_supports_trigram_fts(schema_editor):
+    # The trigram tokenizer appeared in SQLite 3.34
+    if schema_editor.connection.Database.sqlite_version_info < (3, 34):
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def _create_fts_table(schema_editor, table):
+    quote_name = schema_editor.quote_name
+    fts_table = quote_name(get_fts_table(table))
+    columns = ", ".join(NAME_FIELDS)
+    new_values = ", ".join(f"new.{field}" for field in NAME_FIELDS)
+    old_values = ", ".join(f"old.{field}" for field in NAME_FIELDS)
+    delete_old = (
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = (
+        f"INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.id, {new_values});"
+    )
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5({columns}, "
+        f"content={quote_name(table)}, content_rowid=id, tokenize=trigram)"
+    )
+    for trigger, event, body in (
+        ("insert", "INSERT", insert_new),
+        ("delete", "DELETE", delete_old),
+        ("update", "UPDATE", delete_old + " " + insert_new),
+    ):
+        trigger_name = quote_name(f"{get_fts_table(table)}_{trigger}")
+        schema_editor.execute(
+            f"CREATE TRIGGER {trigger_name} AFTER {event} ON {quote_name(table)} "
+            f"BEGIN {body} END"
+        )
+    schema_editor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def _fts_table_exists():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [get_fts_table()],
+        )
+        return cursor.fetchone() is not None
+
+
+def filter_by_name(queryset, term):
+    """Return the carriers of queryset whose legal or DBA name contains term."""
+    if (
+        connection.vendor == "sqlite"
+        and len(term) >= MIN_INDEXED_TERM_LENGTH
+        and _fts_table_exists()
+    ):
+        quote_name = connection.ops.quote_name
+        fts_table = quote_name(get_fts_table())
+        id_column = f"{quote_name(Carrier._meta.db_table)}.{quote_name('id')}"
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        return queryset.extra(
+            where=[
+                f"{id_column} IN "
+                f"(SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s)"
+            ],
+            params=[phrase],
+        )
+    return queryset.filter(Q(legal_name__icontains=term) | Q(dba_name__icontains=term))
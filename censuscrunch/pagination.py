@@ -0,0 +1,165 @@
+"""Keyset pagination of search results.
+
+With page numbers, page N is fetched with OFFSET, which makes the database
+produce and discard all preceding rows, so deep pages get slower and slower.
+With keyset (or seek) pagination, the next page is fetched by asking for the
+rows that sort after the last row of the current page, which costs the same
+for every page as long as the sort columns are indexed.
+
+The position is passed around in an opaque cursor that contains the sort key
+of the row to continue from. The results are always ordered by dot_number
+after the requested sort columns, so the sort key identifies a row; dot_number
+goes in the same direction as the last requested column, so that an index on
+(column, dot_number) can be scanned in either direction. NULLs sort after all
+other values, as is PostgreSQL's default.
+"""
+
+import base64
+import binascii
+import json
+
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+
+from .models import Carrier
+
+TIE_BREAKER = "dot_number"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Keyset:
+    """The columns by which a queryset is sorted, and how to seek in it.
+
+    sort_order is a list of field names, each optionally prefixed with a minus
+    sign for descending order.
+    """
+
+    def __init__(self, sort_order):
+        self.sort_order = [x for x in sort_order if x.lstrip("-") != TIE_BREAKER]
+        descending = bool(self.sort_order) and self.sort_order[-1].startswith("-")
+        self.sort_order.append("-" + TIE_BREAKER if descending else TIE_BREAKER)
+        self.columns = [
+            (
+                x.lstrip("-"),
+                x.startswith("-"),
+                Carrier._meta.get_field(x.lstrip("-")).null,
+            )
+            for x in self.sort_order
+        ]
+
+    def order_by(self, queryset):
+        ordering = []
+        for name, descending, nullable in self.columns:
+            if descending:
+                ordering.append(F(name).desc(nulls_first=nullable))
+            else:
+                ordering.append(F(name).asc(nulls_last=nullable))
+        return queryset.order_by(*ordering)
+
+    def get_key(self, obj):
+        return [getattr(obj, name) for name, descending, nullable in self.columns]
+
+    def seek(self, queryset, key, backwards=False):
+        """Return the rows of the queryset that come after the key.
+
+        If backwards is True, return the rows that come before the key, in
+        reverse order.
+        """
+        if len(key) != len(self.columns):
+            raise InvalidCursor("The cursor does not match the sort order")
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(self.columns, key):
+            beyond = self._greater if descending == backwards else self._less
+            condition |= equal & beyond(name, value, nullable)
+            equal &= Q(**{f"{name}__isnull": True} if value is None else {name: value})
+        queryset = queryset.filter(condition)
+        return queryset.reverse() if backwards else queryset
+
+    def _greater(self, name, value, nullable):
+        # NULL is greater than anything
+        if value is None:
+            return Q(pk__in=[])
+        result = Q(**{f"{name}__gt": value})
+        if nullable:
+            result |= Q(**{f"{name}__isnull": True})
+        return result
+
+    def _less(self, name, value, nullable):
+        if value is None:
+            return Q(**{f"{name}__isnull": False})
+        return Q(**{f"{name}__lt": value})
+
+    def encode_cursor(self, key, backwards=False):
+        data = json.dumps([self.sort_order, key, backwards]).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Return the (key, backwards) pair encoded in the cursor."""
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            sort_order, key, backwards = json.loads(data.decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise InvalidCursor("Malformed cursor")
+        if sort_order != self.sort_order or not isinstance(key, list):
+            raise InvalidCursor("The cursor does not match the sort order")
+        return key, bool(backwards)
+
+
+class KeysetPaginator(Paginator):
+    """A paginator that gets the page by seeking from a cursor, if there's one.
+
+    The object list is sorted according to the keyset. The cursor is one of the
+    "previous_cursor" and "next_cursor" attributes that the pages have in
+    addition to what Django's pages have. The page number is then only used for
+    numbering the page, and must be the one adjacent to the cursor's page. An
+    invalid cursor is ignored.
+    """
+
+    def __init__(self, object_list, per_page, keyset, cursor=None, **kwargs):
+        self.keyset = keyset
+        self.cursor = cursor
+        super().__init__(keyset.order_by(object_list), per_page, **kwargs)
+
+    def page(self, number):
+        if self.cursor:
+            try:
+                return self._page_at_cursor(number)
+            except (InvalidCursor, InvalidPage):
+                pass
+        return super().page(number)
+
+    def _page_at_cursor(self, number):
+        number = self.validate_number(number)
+        key, backwards = self.keyset.decode_cursor(self.cursor)
+        try:
+            queryset = self.keyset.seek(self.object_list, key, backwards)
+            object_list = list(queryset[: self.per_page])
+        except (ValueError, TypeError):
+            raise InvalidCursor("The cursor contains invalid values")
+        if backwards:
+            object_list.reverse()
+        return self._get_page(object_list, number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return KeysetPage(*args, **kwargs)
+
+
+class KeysetPage(Page):
+    @cached_property
+    def previous_cursor(self):
+        if not len(self):
+            return None
+        key = self.paginator.keyset.get_key(self[0])
+        return self.paginator.keyset.encode_cursor(key, backwards=True)
+
+    @cached_property
+    def next_cursor(self):
+        if not len(self):
+            return None
+        key = self.paginator.keyset.get_key(self[len(self) - 1])
+        return self.paginator.keyset.encode_cursor(key)
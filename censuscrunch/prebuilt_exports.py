@@ -0,0 +1,91 @@
+"""Exports of all carriers, and of each state's, written at import time.
+
+Most large downloads are all the carriers of a state. If
+CENSUSCRUNCH_PREBUILT_EXPORTS_DIR is set, importcsv writes, in one pass over
+the carriers, a gzip-compressed CSV file of all of them and one of each state's
+to a subdirectory of that directory named after the data generation. The files
+are what ExportResponse sends in the "csv.gz" format for a search that filters
+by state only, or not at all, and isn't sorted, so SearchView serves such
+downloads from them, in that format and in the "csv" one.
+
+The files are "all.csv.gz" and "state-XX.csv.gz", where XX is the state code.
+"""
+
+import csv
+import gzip
+import io
+import os
+
+from django.conf import settings
+
+from . import export
+from .generation_dirs import build_generation_directory
+from .models import Carrier, DataGeneration
+
+COMPRESSION_LEVEL = 6
+
+
+def get_prebuilt_export(state=None):
+    """Return the filename of the current export of the state, or of all
+    carriers, or None if there's no such file."""
+    root = settings.CENSUSCRUNCH_PREBUILT_EXPORTS_DIR
+    generation = DataGeneration.current() if root else None
+    if generation is None:
+        return None
+    filename = _get_filename(os.path.join(root, str(generation)), state)
+    if filename is None or not os.path.exists(filename):
+        return None
+    return filename
+
+
+def _get_filename(directory, state=None):
+    if state is None:
+        return os.path.join(directory, "all.csv.gz")
+    if not state.isalnum():
+        return None
+    return os.path.join(directory, f"state-{state}.csv.gz")
+
+
+def build_exports(generation):
+    """Write the exports of the carriers of the specified data generation.
+
+    The exports of other generations are removed. The files are ASCII, like the
+    downloads; if a carrier's data isn't, UnicodeEncodeError is raised, and
+    nothing is written.
+    """
+    build_generation_directory(
+        settings.CENSUSCRUNCH_PREBUILT_EXPORTS_DIR, generation, _write_exports
+    )
+
+
+def _write_exports(directory):
+    files = []
+    state_writers = {}
+    state_index = export.CSV_FIELDS.index("physical_state")
+    rows = Carrier.objects.order_by("dot_number").values_list(*export.CSV_FIELDS)
+    try:
+        all_writer = _open_writer(_get_filename(directory), files)
+        for row in export.format_rows(rows.iterator(chunk_size=10_000)):
+            all_writer.writerow(row)
+            state = row[state_index]
+            if state not in state_writers:
+                filename = _get_filename(directory, state) if state else None
+                state_writers[state] = filename and _open_writer(filename, files)
+            if state_writers[state]:
+                state_writers[state].writerow(row)
+    finally:
+        for f in files:
+            f.close()
+
+
+def _open_writer(filename, files):
+    # ASCII, like ExportResponse
+    f = io.TextIOWrapper(
+        gzip.open(filename, "wb", compresslevel=COMPRESSION_LEVEL),
+        encoding="us-ascii",
+        newline="",
+    )
+    files.append(f)
+    writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerow(export.CSV_HEADINGS)
+    return writer
@@ -0,0 +1,73 @@
+"""An in-process cache of search result pages.
+
+The census data only changes when importcsv runs, so a page of search results
+can be served from memory until the next import; the cache keys (from
+counting.get_cache_key) include the data generation, which every import
+advances, so stale entries are never hit and just age out.
+
+Each process (e.g. each gunicorn worker) has its own cache. Its size is bounded
+by CENSUSCRUNCH_RESULT_CACHE_SIZE, in bytes of pickled entries; when it's full,
+the least recently used entries are evicted. Zero disables the cache.
+"""
+
+import pickle
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class LRUCache:
+    """A dictionary-like cache limited to max_size bytes of pickled values.
+
+    The values are stored pickled, so that their size is known and so that
+    callers can't modify the cached copy.
+    """
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+
+    @property
+    def max_size(self):
+        if self._max_size is None:
+            return settings.CENSUSCRUNCH_RESULT_CACHE_SIZE
+        return self._max_size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                data = self._entries[key]
+            except KeyError:
+                return default
+            self._entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._discard(key)
+            if len(data) > self.max_size:
+                return
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        data = self._entries.pop(key, None)
+        if data is not None:
+            self.size -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+result_cache = LRUCache()
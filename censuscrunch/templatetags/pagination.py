@@ -7,5 +7,23 @@ register = template.Library()
 def urlparams_set_page(context, page):
     query = context["request"].GET.copy()
     query.pop("page", None)
+    query.pop("cursor", None)
     query.update({"page": page})
     return query.urlencode()
+
+
+@register.simple_tag(takes_context=True)
+def urlparams_set_cursor(context, page, cursor):
+    """Like urlparams_set_page, but for getting the page by seeking from a cursor.
+
+    The cursor is the "previous_cursor" or "next_cursor" attribute of the current
+    page, and the page number must be the number of the previous or next page.
+    Pages that don't have cursors get plain page links.
+    """
+    if not cursor:
+        return urlparams_set_page(context, page)
+    query = context["request"].GET.copy()
+    query.pop("page", None)
+    query.pop("cursor", None)
+    query.update({"page": page, "cursor": cursor})
+    return query.urlencode()
@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+from censuscrunch import bitmaps
+from censuscrunch.bitmaps import Bitmap, BitmapIndex, write_bitmap_index
+
+SIZE = 1000
+
+
+@skipIf(bitmaps.np is None, "NumPy is not installed")
+class BitmapTestCase(SimpleTestCase):
+    def setUp(self):
+        self.sets = {
+            "sparse1": set(range(0, SIZE, 100)),
+            "sparse2": set(range(0, SIZE, 150)),
+            "dense1": set(range(0, SIZE, 2)),
+            "dense2": set(range(0, SIZE, 3)),
+        }
+        self.bitmaps = {
+            name: Bitmap.from_rows(sorted(rows), SIZE)
+            for name, rows in self.sets.items()
+        }
+
+    def test_representation(self):
+        self.assertIsNotNone(self.bitmaps["sparse1"].rows)
+        self.assertIsNotNone(self.bitmaps["dense1"].bits)
+
+    def test_len(self):
+        for name, bitmap in self.bitmaps.items():
+            with self.subTest(bitmap=name):
+                self.assertEqual(len(bitmap), len(self.sets[name]))
+
+    def test_and(self):
+        for a in self.bitmaps:
+            for b in self.bitmaps:
+                with self.subTest(a=a, b=b):
+                    result = self.bitmaps[a] & self.bitmaps[b]
+                    expected = sorted(self.sets[a] & self.sets[b])
+                    self.assertEqual(result.to_rows().tolist(), expected)
+                    self.assertEqual(len(result), len(expected))
+
+    def test_or(self):
+        for a in self.bitmaps:
+            for b in self.bitmaps:
+                with self.subTest(a=a, b=b):
+                    result = self.bitmaps[a] | self.bitmaps[b]
+                    expected = sorted(self.sets[a] | self.sets[b])
+                    self.assertEqual(result.to_rows().tolist(), expected)
+
+    def test_full(self):
+        self.assertEqual(len(Bitmap.full(SIZE)), SIZE)
+
+
+@skipIf(bitmaps.np is None, "NumPy is not installed")
+class BitmapIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        states = ["NY", "CA", "NY", "MA", "CA", "NY"]
+        columns = {field: states for field in bitmaps.FIELDS}
+        columns["oic_state"] = ["MA"] * 6
+        columns["carrier_operation"] = ["A", "A", "B", "C", "A", "A"]
+        columns["hm"] = [True, False, False, True, False, True]
+        write_bitmap_index(self.directory, columns, 6)
+        self.index = BitmapIndex(self.directory)
+
+    def _select(self, conditions):
+        return self.index.select(conditions).to_rows().tolist()
+
+    def test_select_value(self):
+        self.assertEqual(self._select({"physical_state": "NY"}), [0, 2, 5])
+
+    def test_select_values(self):
+        self.assertEqual(self._select({"physical_state": ["CA", "MA"]}), [1, 3, 4])
+
+    def test_select_combination(self):
+        conditions = {"physical_state": "NY", "carrier_operation": "A", "hm": True}
+        self.assertEqual(self._select(conditions), [0, 5])
+
+    def test_select_missing_value(self):
+        self.assertEqual(self._select({"physical_state": "XX", "hm": True}), [])
+
+    def test_select_all(self):
+        self.assertEqual(self._select({}), [0, 1, 2, 3, 4, 5])
+
+    def test_count(self):
+        self.assertEqual(self.index.count({"oic_state": "MA", "hm": False}), 3)
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from bs4 import BeautifulSoup
+from model_mommy import mommy
+
+from censuscrunch import columnar, models
+
+CARRIERS = (
+    # legal_name, dba_name, physical_state, number_of_power_units, number_of_drivers
+    ("Killer Carrier, Inc", "Killer Carrier", "NY", 5, 7),
+    ("Transport Greatness", "", "CA", 10, None),
+    ("Alpha Trans", "", "NY", None, 3),
+    ("beta carrier", "Zeta", "MA", 5, 7),
+    ("Alpha Trans", "", "CA", 1, 2),
+    ("Gamma", "Carrier Gamma", "NY", 5, None),
+)
+
+
+@skipIf(columnar.np is None, "NumPy is not installed")
+@override_settings(CENSUSCRUNCH_RESULT_CACHE_SIZE=0)
+class ColumnarEngineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.columns_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.columns_dir)
+        for i, values in enumerate(CARRIERS):
+            legal_name, dba_name, state, power_units, drivers = values
+            mommy.make(
+                models.Carrier,
+                id=i + 1,
+                dot_number=60 - i,
+                legal_name=legal_name,
+                dba_name=dba_name,
+                physical_state=state,
+                number_of_power_units=power_units,
+                number_of_drivers=drivers,
+            )
+        models.DataGeneration.advance()
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=self.columns_dir):
+            columnar.build_columns(models.DataGeneration.current())
+
+    def _get_ids(self, query_string, use_engine=True):
+        columns_dir = self.columns_dir if use_engine else None
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=columns_dir):
+            response = self.client.get("/?" + query_string)
+        soup = BeautifulSoup(response.content, "lxml")
+        table_rows = soup.find("table").find_all("tr")[1:]
+        return [int(row.td.a["href"].split("/")[2]) for row in table_rows]
+
+    def test_same_results_as_database(self):
+        for query_string in (
+            "state=NY",
+            "state=XX",
+            "q=carrier",
+            "q=ab",
+            "q=TRANS&state=CA",
+            "min_number_of_power_units=5",
+            "max_number_of_power_units=5&sort=-number_of_power_units",
+            "sort=name",
+            "sort=-name",
+            "sort=number_of_drivers",
+            "sort=physical_state&sort=-number_of_drivers",
+            "state=NY&sort=-physical_state&sort=name",
+        ):
+            with self.subTest(query_string=query_string):
+                self.assertEqual(
+                    self._get_ids(query_string),
+                    self._get_ids(query_string, use_engine=False),
+                )
+
+    def test_does_not_count_in_database(self):
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=self.columns_dir):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/?q=carrier")
+        self.assertContains(response, "3 records")
+        self.assertFalse([q for q in queries if "COUNT" in q["sql"]])
+
+    def test_paginates(self):
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=self.columns_dir):
+            engine = columnar.get_engine()
+        result = engine.search({}, ["name"])
+        self.assertEqual(len(result), 6)
+        self.assertEqual([c.id for c in result[1:3]], [3, 6])
+        self.assertEqual(result[0].id, 5)
+
+    def test_select(self):
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=self.columns_dir):
+            engine = columnar.get_engine()
+        result = engine.select({"physical_state": ["NY", "MA"]})
+        self.assertEqual([c.id for c in result[:]], [6, 4, 3, 1])
+
+    def test_no_engine_before_columns_are_built(self):
+        models.DataGeneration.advance()
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=self.columns_dir):
+            self.assertIsNone(columnar.get_engine())
+
+    def test_removes_old_generations(self):
+        models.DataGeneration.advance()
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=self.columns_dir):
+            columnar.build_columns(models.DataGeneration.current())
+        self.assertEqual(os.listdir(self.columns_dir), ["2"])
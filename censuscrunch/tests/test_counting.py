@@ -0,0 +1,70 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from model_mommy import mommy
+
+from censuscrunch import models
+from censuscrunch.counting import ResultCount, count_results, get_cache_key
+
+
+@override_settings(CENSUSCRUNCH_ROW_LIMIT=2)
+class CountResultsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for dot_number in (42, 43, 44):
+            mommy.make(models.Carrier, dot_number=dot_number, physical_state="NY")
+        mommy.make(models.Carrier, dot_number=45, physical_state="CA")
+        self.queryset = models.Carrier.objects.all()
+
+    def _count(self, state):
+        return count_results(self.queryset.filter(physical_state=state), {"s": state})
+
+    def test_counts_up_to_limit(self):
+        result = self._count("CA")
+        self.assertEqual(result.value, 1)
+        self.assertFalse(result.exceeds_limit)
+
+    def test_stops_counting_after_limit(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self._count("NY")
+        self.assertEqual(result.value, 3)
+        self.assertTrue(result.exceeds_limit)
+        self.assertIn("LIMIT 3", queries.captured_queries[-1]["sql"])
+
+    def test_not_cached_before_first_import(self):
+        self._count("CA")
+        mommy.make(models.Carrier, dot_number=46, physical_state="CA")
+        self.assertEqual(self._count("CA").value, 2)
+
+    def test_cached_until_next_import(self):
+        models.DataGeneration.advance()
+        self._count("CA")
+        mommy.make(models.Carrier, dot_number=46, physical_state="CA")
+        self.assertEqual(self._count("CA").value, 1)
+        models.DataGeneration.advance()
+        self.assertEqual(self._count("CA").value, 2)
+
+
+class GetCacheKeyTestCase(TestCase):
+    def setUp(self):
+        models.DataGeneration.advance()
+
+    def test_does_not_depend_on_filter_order(self):
+        self.assertEqual(
+            get_cache_key("count", {"a": 1, "b": 2}),
+            get_cache_key("count", {"b": 2, "a": 1}),
+        )
+
+    def test_depends_on_generation(self):
+        key = get_cache_key("count", {"a": 1})
+        models.DataGeneration.advance()
+        self.assertNotEqual(get_cache_key("count", {"a": 1}), key)
+
+
+class ResultCountTestCase(TestCase):
+    def test_exceeds_limit(self):
+        self.assertFalse(ResultCount(50, 50).exceeds_limit)
+        self.assertTrue(ResultCount(51, 50).exceeds_limit)
@@ -0,0 +1,56 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import skipIf, skipUnless
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from censuscrunch import columnar, models
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans")
+class ExplainSearchesTestCase(TestCase):
+    def setUp(self):
+        self.stdout = StringIO()
+
+    def _explain(self, *args, **kwargs):
+        call_command("explainsearches", *args, stdout=self.stdout, **kwargs)
+        return self.stdout.getvalue()
+
+    def test_default_searches_use_indexes(self):
+        output = self._explain()
+        self.assertIn("ok       page  state=NY\n", output)
+        self.assertNotIn("SEQ SCAN", output)
+
+    def test_no_count_without_filters(self):
+        output = self._explain("sort=name", "state=NY&sort=name")
+        self.assertEqual(
+            output,
+            "ok       page  sort=name\n"
+            "ok       page  state=NY&sort=name\n"
+            "ok       count state=NY&sort=name\n",
+        )
+
+    def test_shows_plans(self):
+        output = self._explain("state=NY", verbosity=2)
+        self.assertRegex(output, r"\n    .*SEARCH censuscrunch_carrier USING")
+
+    def test_fails_on_sequential_scan(self):
+        # Terms shorter than three characters can't use the name search index
+        with self.assertRaisesRegex(CommandError, "^1 of 4 queries"):
+            self._explain("state=NY", "q=ab")
+        self.assertIn("SEQ SCAN count q=ab\n", self.stdout.getvalue())
+
+    @skipIf(columnar.np is None, "NumPy is not installed")
+    def test_explains_database_queries_with_columnar_engine(self):
+        columns_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, columns_dir)
+        models.DataGeneration.advance()
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=columns_dir):
+            columnar.build_columns(models.DataGeneration.current())
+            self.assertIsNotNone(columnar.get_engine())
+            output = self._explain("state=NY")
+        self.assertIn("ok       page  state=NY\n", output)
@@ -0,0 +1,87 @@
+import datetime as dt
+import gzip
+import io
+import json
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase, TestCase
+
+from model_mommy import mommy
+
+from censuscrunch import export, models
+
+
+class FormatRowsTestCase(SimpleTestCase):
+    def test_formats_flags_and_dates_only(self):
+        formatted_fields = [export.CSV_FIELDS[i] for i, f in export.get_formatters()]
+        self.assertEqual(
+            formatted_fields, ["hm", "pc", "mcs150_date", "date_added_mcmis"]
+        )
+
+    def test_format_rows(self):
+        fields = ["dot_number", "hm", "pc", "mcs150_date", "date_added_mcmis"]
+        rows = [(42, True, False, None, dt.date(2019, 2, 4))]
+        self.assertEqual(
+            list(export.format_rows(rows, fields)), [[42, "Y", "N", None, "04-FEB-19"]],
+        )
+
+
+class ExportFormatsTestCase(TestCase):
+    def setUp(self):
+        for dot_number in range(1, 6):
+            mommy.make(
+                models.Carrier,
+                dot_number=dot_number,
+                hm=dot_number % 2 == 0,
+                mcs150_date=dt.date(2020, 3, dot_number) if dot_number > 1 else None,
+                mcs150_mileage=None if dot_number == 1 else 1000 * dot_number,
+            )
+        self.queryset = models.Carrier.objects.order_by("dot_number")
+
+    def _generate(self, format_name, **kwargs):
+        return b"".join(export.FORMATS[format_name].generate(self.queryset, **kwargs))
+
+    def test_csv_gz(self):
+        self.assertEqual(
+            gzip.decompress(self._generate("csv.gz", buffer_size=1)),
+            self._generate("csv"),
+        )
+
+    def test_jsonl(self):
+        lines = self._generate("jsonl", buffer_size=1).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        first, second = json.loads(lines[0]), json.loads(lines[1])
+        self.assertEqual(list(first), export.CSV_HEADINGS)
+        self.assertEqual(first["DOT_NUMBER"], 1)
+        self.assertIs(first["HM_FLAG"], False)
+        self.assertIsNone(first["MCS150_DATE"])
+        self.assertIsNone(first["MCS150_MILEAGE"])
+        self.assertIs(second["HM_FLAG"], True)
+        self.assertEqual(second["MCS150_DATE"], "2020-03-02")
+        self.assertEqual(second["MCS150_MILEAGE"], 2000)
+
+    def _check_arrow_table(self, table):
+        self.assertEqual(table.schema, export.get_arrow_schema())
+        self.assertEqual(table.column("DOT_NUMBER").to_pylist(), [1, 2, 3, 4, 5])
+        self.assertEqual(
+            table.column("HM_FLAG").to_pylist(), [False, True, False, True, False]
+        )
+        self.assertEqual(
+            table.column("MCS150_DATE").to_pylist()[:2], [None, dt.date(2020, 3, 2)]
+        )
+        self.assertEqual(table.column("MCS150_MILEAGE").to_pylist()[:2], [None, 2000])
+
+    @skipIf(export.pa is None, "pyarrow is not installed")
+    @mock.patch("censuscrunch.export.ARROW_BATCH_SIZE", 2)
+    def test_parquet(self):
+        content = self._generate("parquet", buffer_size=1)
+        parquet_file = export.pq.ParquetFile(io.BytesIO(content))
+        self.assertEqual(parquet_file.num_row_groups, 3)
+        self._check_arrow_table(parquet_file.read())
+
+    @skipIf(export.pa is None, "pyarrow is not installed")
+    @mock.patch("censuscrunch.export.ARROW_BATCH_SIZE", 2)
+    def test_arrow(self):
+        chunks = list(export.FORMATS["arrow"].generate(self.queryset, buffer_size=1))
+        self.assertEqual(len(chunks), 3)
+        self._check_arrow_table(export.pa.ipc.open_stream(b"".join(chunks)).read_all())
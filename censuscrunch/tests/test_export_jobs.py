@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from model_mommy import mommy
+
+from censuscrunch import export_jobs, models
+
+
+@override_settings(CENSUSCRUNCH_ROW_LIMIT=1, CENSUSCRUNCH_EXPORT_WORKERS=0)
+class ExportJobTestCaseBase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        exports_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, exports_dir)
+        settings_override = override_settings(CENSUSCRUNCH_EXPORTS_DIR=exports_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        mommy.make(models.Carrier, dot_number=42, legal_name="Killer Carrier")
+        mommy.make(models.Carrier, dot_number=43, legal_name="Transport Greatness")
+        mommy.make(models.Carrier, dot_number=44, legal_name="Lone Carrier")
+
+
+class ExportJobTestCase(ExportJobTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        models.DataGeneration.advance()
+
+    def test_exports_in_background(self):
+        r = self.client.get("/?q=carrier&sort=-name&format=csv", follow=True)
+        self.assertContains(r, "Download the CSV file")
+        job = models.ExportJob.objects.get()
+        self.assertEqual(job.status, job.DONE)
+        self.assertEqual(job.query_string, "q=carrier&sort=-name")
+        r = self.client.get(f"/exports/{job.id}/download/")
+        self.assertEqual(r["Content-Type"], "text/csv")
+        lines = b"".join(r.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('44,"Lone Carrier"'))
+        self.assertTrue(lines[2].startswith('42,"Killer Carrier"'))
+        self.assertEqual(job.size, os.path.getsize(job.filename))
+
+    def test_exports_other_formats(self):
+        job = export_jobs.get_export_job({"q": "carrier"}, [], "jsonl")
+        self.assertTrue(job.filename.endswith(".jsonl"))
+        r = self.client.get(f"/exports/{job.id}/")
+        self.assertContains(r, "Download the JSON Lines file")
+        r = self.client.get(f"/exports/{job.id}/download/")
+        self.assertEqual(r["Content-Type"], "application/x-ndjson")
+        self.assertIn('filename="fmcsacensuscrunch.jsonl"', r["Content-Disposition"])
+        self.assertEqual(len(b"".join(r.streaming_content).splitlines()), 2)
+        csv_job = export_jobs.get_export_job({"q": "carrier"}, [])
+        self.assertNotEqual(csv_job, job)
+
+    def test_exports_everything_without_filters(self):
+        job = export_jobs.get_export_job({}, [])
+        with open(job.filename) as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+    @mock.patch("censuscrunch.export_jobs.submit")
+    def test_identical_requests_share_a_job(self, submit):
+        first_job = export_jobs.get_export_job({"state": "NY"}, ["name"])
+        second_job = export_jobs.get_export_job({"state": "NY"}, ["name"])
+        other_job = export_jobs.get_export_job({"state": "NY"}, ["-name"])
+        self.assertEqual(first_job, second_job)
+        self.assertNotEqual(first_job, other_job)
+        self.assertEqual(submit.call_count, 2)
+
+    def test_new_job_after_import(self):
+        old_job = export_jobs.get_export_job({}, [])
+        models.DataGeneration.advance()
+        new_job = export_jobs.get_export_job({}, [])
+        self.assertNotEqual(new_job, old_job)
+        self.assertFalse(models.ExportJob.objects.filter(id=old_job.id).exists())
+        self.assertFalse(os.path.exists(old_job.filename))
+
+    def test_retries_failed_job(self):
+        with mock.patch.object(
+            export_jobs, "get_queryset", side_effect=RuntimeError("oops")
+        ):
+            job = export_jobs.get_export_job({}, [])
+        self.assertEqual(job.status, job.FAILED)
+        self.assertIn("RuntimeError: oops", job.error)
+        self.assertFalse(os.listdir(os.path.dirname(job.filename)))
+        r = self.client.get(f"/exports/{job.id}/")
+        self.assertContains(r, "The export has failed.")
+        self.assertEqual(
+            self.client.get(f"/exports/{job.id}/download/").status_code, 404
+        )
+        job = export_jobs.get_export_job({}, [])
+        self.assertEqual(job.status, job.DONE)
+
+    @mock.patch("censuscrunch.export_jobs.submit")
+    def test_resubmits_stale_job(self, submit):
+        job = export_jobs.get_export_job({}, [])
+        for status in (job.PENDING, job.RUNNING):
+            with self.subTest(status=status):
+                submit.reset_mock()
+                export_jobs.get_export_job({}, [])
+                self.assertFalse(submit.called)
+                models.ExportJob.objects.filter(id=job.id).update(
+                    status=status,
+                    heartbeat=timezone.now() - export_jobs.STALE_AFTER * 2,
+                )
+                job = export_jobs.get_export_job({}, [])
+                submit.assert_called_once_with(job.id)
+                self.assertEqual(job.status, job.PENDING)
+        submit.side_effect = export_jobs.run_job
+        models.ExportJob.objects.filter(id=job.id).update(heartbeat=None)
+        job = export_jobs.get_export_job({}, [])
+        self.assertEqual(job.status, job.DONE)
+
+    @mock.patch("censuscrunch.export_jobs.submit")
+    def test_status_page_refreshes_until_done(self, submit):
+        job = export_jobs.get_export_job({}, [])
+        r = self.client.get(f"/exports/{job.id}/")
+        self.assertContains(r, 'http-equiv="refresh"')
+        self.assertContains(r, "Waiting since")
+        self.assertEqual(
+            self.client.get(f"/exports/{job.id}/download/").status_code, 404
+        )
+
+
+class ExportJobBeforeImportTestCase(ExportJobTestCaseBase):
+    def test_requests_dont_share_jobs(self):
+        first_job = export_jobs.get_export_job({"q": "transport"}, [])
+        second_job = export_jobs.get_export_job({"q": "carrier"}, [])
+        third_job = export_jobs.get_export_job({"q": "carrier"}, [])
+        self.assertEqual(len({first_job, second_job, third_job}), 3)
+        self.assertEqual(second_job.query_string, "q=carrier")
+        with open(second_job.filename) as f:
+            self.assertEqual(len(f.readlines()), 3)
@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from censuscrunch.generation_dirs import build_generation_directory
+
+
+def write_files(directory):
+    with open(os.path.join(directory, "data"), "w") as f:
+        f.write("data")
+
+
+def fail(directory):
+    write_files(directory)
+    raise RuntimeError("oops")
+
+
+class BuildGenerationDirectoryTestCase(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        build_generation_directory(self.root, 1, write_files)
+
+    def test_writes_files(self):
+        self.assertEqual(os.listdir(os.path.join(self.root, "1")), ["data"])
+
+    def test_removes_other_generations(self):
+        os.makedirs(os.path.join(self.root, "0.tmp"))
+        os.makedirs(os.path.join(self.root, "other"))
+        build_generation_directory(self.root, 2, write_files)
+        self.assertEqual(sorted(os.listdir(self.root)), ["2", "other"])
+
+    def test_leaves_nothing_behind_on_error(self):
+        with self.assertRaisesRegex(RuntimeError, "oops"):
+            build_generation_directory(self.root, 2, fail)
+        self.assertEqual(os.listdir(self.root), ["1"])
@@ -0,0 +1,674 @@
+import bz2
+import csv
+import datetime as dt
+import gzip
+import json
+import lzma
+import os
+import pstats
+import shutil
+import tempfile
+import zipfile
+from io import StringIO
+from unittest import mock, skipIf
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from benchmarks.census import write_census
+from censuscrunch import columnar, models, prebuilt_exports
+from censuscrunch.management.commands.importcsv import (
+    CopyStream,
+    ImportStats,
+    ShadowTable,
+    get_chunks,
+    get_fingerprint,
+    get_index_names,
+    str2date,
+)
+from censuscrunch.name_search import filter_by_name
+
+HEADING = (
+    "DOT_NUMBER,LEGAL_NAME,DBA_NAME,CARRIER_OPERATION,HM_FLAG,PC_FLAG,"
+    "PHY_STREET,PHY_CITY,PHY_STATE,PHY_ZIP,PHY_COUNTRY,MAILING_STREET,"
+    "MAILING_CITY,MAILING_STATE,MAILING_ZIP,MAILING_COUNTRY,TELEPHONE,FAX,"
+    "EMAIL_ADDRESS,MCS150_DATE,MCS150_MILEAGE,MCS150_MILEAGE_YEAR,ADD_DATE,"
+    "OIC_STATE,NBR_POWER_UNIT,DRIVER_TOTAL\n"
+)
+
+
+def make_row(dot_number, legal_name="Killer Carrier", state="NY", **kwargs):
+    values = {
+        "dot_number": dot_number,
+        "legal_name": legal_name,
+        "state": state,
+        "hm": "N",
+        "mcs150_date": "05-MAR-20",
+        "power_units": "5",
+    }
+    values.update(kwargs)
+    return (
+        '{dot_number},"{legal_name}","","A",{hm},"N","0 Abyss Alley","Nowhere",'
+        '"{state}","12345","US","0 Abyss Alley","Nowhere","{state}","12345","US",'
+        '"+123456789","","alice@killercarrier.com","{mcs150_date}",18725329,2020,'
+        '"04-FEB-19","MA",{power_units},4\n'
+    ).format(**values)
+
+
+class ImportCsvTestCaseBase(TransactionTestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, "census.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write_csv(self, rows):
+        with open(self.filename, "w") as f:
+            f.write(HEADING)
+            f.write("".join(rows))
+
+    def _import(self, *args, **kwargs):
+        kwargs.setdefault("stderr", StringIO())
+        call_command("importcsv", self.filename, *args, **kwargs)
+
+
+class ImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self._write_csv([make_row(n) for n in range(42, 49)])
+
+    def test_imports_all_rows(self):
+        self._import(batch_size=3)
+        self.assertEqual(models.Carrier.objects.count(), 7)
+
+    def test_converts_values(self):
+        self._import(batch_size=3)
+        carrier = models.Carrier.objects.get(dot_number=42)
+        self.assertEqual(carrier.legal_name, "Killer Carrier")
+        self.assertEqual(carrier.name, "Killer Carrier")
+        self.assertFalse(carrier.hm)
+        self.assertEqual(carrier.mcs150_date, dt.date(2020, 3, 5))
+        self.assertEqual(carrier.number_of_power_units, 5)
+
+    @skipIf(columnar.np is None, "NumPy is not installed")
+    def test_writes_search_columns(self):
+        with override_settings(CENSUSCRUNCH_COLUMNS_DIR=self.tempdir):
+            self._import()
+            engine = columnar.get_engine()
+        self.assertEqual(len(engine.search({"state": "NY"}, [])), 7)
+
+    def test_writes_prebuilt_exports(self):
+        with override_settings(CENSUSCRUNCH_PREBUILT_EXPORTS_DIR=self.tempdir):
+            self._import()
+            filename = prebuilt_exports.get_prebuilt_export("NY")
+        with gzip.open(filename, "rt") as f:
+            self.assertEqual(len(f.readlines()), 8)
+
+    def test_skips_prebuilt_exports_of_non_ascii_data(self):
+        self._write_csv([make_row(42), make_row(43, legal_name="Caf\u00e9 Trucking")])
+        exports_dir = os.path.join(self.tempdir, "exports")
+        stderr = StringIO()
+        with override_settings(CENSUSCRUNCH_PREBUILT_EXPORTS_DIR=exports_dir):
+            self._import(stderr=stderr)
+            self.assertIsNone(prebuilt_exports.get_prebuilt_export("NY"))
+        self.assertEqual(models.Carrier.objects.count(), 2)
+        self.assertIn("Not writing the prebuilt exports: ", stderr.getvalue())
+        self.assertEqual(os.listdir(exports_dir), [])
+
+    def test_normalises_codes(self):
+        self._write_csv([make_row(42, state=" ny")])
+        self._import()
+        carrier = models.Carrier.objects.get(dot_number=42)
+        self.assertEqual(carrier.physical_state, "NY")
+        self.assertEqual(carrier.mailing_state, "NY")
+
+    def test_replaces_existing_records(self):
+        self._import()
+        self._write_csv([make_row(50)])
+        self._import()
+        self.assertEqual(
+            list(models.Carrier.objects.values_list("dot_number", flat=True)), [50]
+        )
+
+    def test_copy_engine_falls_back_to_orm(self):
+        self._import(engine="copy")
+        self.assertEqual(models.Carrier.objects.count(), 7)
+
+    def test_rejects_bad_batch_size(self):
+        with self.assertRaisesRegex(CommandError, "batch-size"):
+            self._import(batch_size=0)
+
+    def test_advances_data_generation(self):
+        self._import()
+        self._import()
+        self.assertEqual(models.DataGeneration.current(), 2)
+
+    def test_imports_synthetic_census(self):
+        with open(self.filename, "w", newline="") as f:
+            write_census(f, 300)
+        self._import(batch_size=100)
+        self.assertEqual(models.Carrier.objects.count(), 300)
+
+
+@mock.patch("censuscrunch.management.commands.importcsv.CHUNK_SIZE", 1000)
+class ParallelImportCsvTestCase(ImportCsvTestCaseBase):
+    def test_imports_all_rows(self):
+        self._write_csv([make_row(n) for n in range(42, 72)])
+        self._import(workers=2, batch_size=7)
+        self.assertEqual(models.Carrier.objects.count(), 30)
+
+    def test_conversion_error_reports_line(self):
+        rows = [make_row(n) for n in range(42, 72)]
+        rows[24] = make_row(66, hm="X")
+        self._write_csv(rows)
+        with self.assertRaisesRegex(CommandError, "Error in line 26: "):
+            self._import(workers=2)
+
+
+class CompressedImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self.content = HEADING + "".join(make_row(n) for n in range(42, 72))
+
+    def _import_compressed(self, extension, opener, **kwargs):
+        self.filename = os.path.join(self.tempdir, "census.csv" + extension)
+        with opener(self.filename, "wt") as f:
+            f.write(self.content)
+        self._import(**kwargs)
+        self.assertEqual(models.Carrier.objects.count(), 30)
+
+    def test_gz(self):
+        self._import_compressed(".gz", gzip.open)
+
+    def test_bz2(self):
+        self._import_compressed(".bz2", bz2.open)
+
+    def test_xz(self):
+        self._import_compressed(".xz", lzma.open)
+
+    @mock.patch("censuscrunch.management.commands.importcsv.CHUNK_SIZE", 1000)
+    def test_gz_in_parallel(self):
+        self._import_compressed(".gz", gzip.open, workers=2)
+
+    def test_zip(self):
+        self.filename = os.path.join(self.tempdir, "census.zip")
+        with zipfile.ZipFile(self.filename, "w") as f:
+            f.writestr("census.txt", "Unrelated")
+            f.writestr("census.csv", self.content)
+        self._import()
+        self.assertEqual(models.Carrier.objects.count(), 30)
+
+    def test_zip_without_csv_file(self):
+        self.filename = os.path.join(self.tempdir, "census.zip")
+        with zipfile.ZipFile(self.filename, "w") as f:
+            f.writestr("census.txt", "Unrelated")
+            f.writestr("census2.txt", "Unrelated")
+        with self.assertRaisesRegex(CommandError, "exactly one CSV file"):
+            self._import()
+
+    def test_corrupt_gz(self):
+        self.filename = os.path.join(self.tempdir, "census.csv.gz")
+        with open(self.filename, "w") as f:
+            f.write(self.content)
+        with self.assertRaises(CommandError):
+            self._import()
+
+    def test_stdin(self):
+        self.filename = "-"
+        with mock.patch("sys.stdin", StringIO(self.content)):
+            self._import()
+        self.assertEqual(models.Carrier.objects.count(), 30)
+
+
+class RejectsImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self.rejects_filename = os.path.join(self.tempdir, "rejects.csv")
+        self.stdout = StringIO()
+        rows = [make_row(n) for n in range(42, 48)]
+        rows[1] = make_row(43, hm="X")
+        rows[4] = make_row(42)
+        self._write_csv(rows)
+
+    def _import_with_rejects(self, **kwargs):
+        self._import(
+            max_errors=2, rejects=self.rejects_filename, stdout=self.stdout, **kwargs
+        )
+
+    def _read_rejects(self):
+        with open(self.rejects_filename, newline="") as f:
+            return list(csv.reader(f))
+
+    def test_imports_other_rows(self):
+        self._import_with_rejects(batch_size=3)
+        self.assertEqual(
+            list(models.Carrier.objects.values_list("dot_number", flat=True)),
+            [42, 44, 45, 47],
+        )
+
+    def test_rejects_file_heading(self):
+        self._import_with_rejects(batch_size=3)
+        self.assertEqual(self._read_rejects()[0][:3], ["LINE", "ERROR", "DOT_NUMBER"])
+
+    def test_conversion_error_in_rejects_file(self):
+        self._import_with_rejects(batch_size=3)
+        line, error, *row = self._read_rejects()[1]
+        self.assertEqual(line, "3")
+        self.assertIn("'Y' and 'N'", error)
+        self.assertEqual(row[:2], ["43", "Killer Carrier"])
+        self.assertEqual(row[4], "X")
+
+    def test_database_error_in_rejects_file(self):
+        self._import_with_rejects(batch_size=3)
+        line, error, *row = self._read_rejects()[2]
+        self.assertEqual(line, "6")
+        self.assertIn("UNIQUE", error)
+        self.assertEqual(row[:2], ["42", "Killer Carrier"])
+        self.assertEqual(row[19], "05-MAR-20")
+
+    def test_conversion_error_in_parallel(self):
+        self._import_with_rejects(batch_size=3, workers=2)
+        self.assertEqual(self._read_rejects()[1][0], "3")
+
+    def test_summary(self):
+        self._import_with_rejects()
+        self.assertEqual(self.stdout.getvalue(), "2 rows rejected\n")
+
+    def test_blank_line(self):
+        rows = [make_row(n) for n in range(42, 46)]
+        rows[1] = "\n"
+        self._write_csv(rows)
+        for kwargs in ({}, {"workers": 2}, {"incremental": True}):
+            with self.subTest(**kwargs):
+                self._import_with_rejects(batch_size=3, **kwargs)
+                self.assertEqual(
+                    self._read_rejects()[1][:2], ["3", "expected 26 fields, got 0"]
+                )
+                self.assertEqual(models.Carrier.objects.count(), 3)
+
+    def test_too_many_errors(self):
+        with self.assertRaisesRegex(CommandError, "Error in line 6: "):
+            self._import(max_errors=1)
+
+
+class ResumeImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self.rows = [make_row(n) for n in range(42, 48)]
+
+    def _create_checkpoint(self, line_number):
+        offset = len(HEADING) + len("".join(self.rows[: line_number - 1]))
+        models.ImportCheckpoint.objects.create(
+            filename=os.path.abspath(self.filename),
+            fingerprint=get_fingerprint(self.filename),
+            offset=offset,
+            line_number=line_number,
+        )
+
+    def test_saves_checkpoint_at_commit(self):
+        self.rows[4] = make_row(46, hm="X")
+        self._write_csv(self.rows)
+        with self.assertRaises(CommandError):
+            self._import(resume=True, batch_size=2)
+        checkpoint = models.ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.line_number, 5)
+        self.assertEqual(checkpoint.offset, len(HEADING + "".join(self.rows[:4])))
+
+    def test_continues_from_checkpoint(self):
+        self._write_csv(self.rows[:3])
+        self._import()
+        self._write_csv(self.rows)
+        self._create_checkpoint(4)
+        self._import(resume=True)
+        self.assertEqual(models.Carrier.objects.count(), 6)
+
+    def test_continues_from_checkpoint_in_parallel(self):
+        self._write_csv(self.rows[:3])
+        self._import()
+        self._write_csv(self.rows)
+        self._create_checkpoint(4)
+        self._import(resume=True, workers=2)
+        self.assertEqual(models.Carrier.objects.count(), 6)
+
+    def test_deletes_checkpoint_when_finished(self):
+        self._write_csv(self.rows)
+        self._import(resume=True, batch_size=2)
+        self.assertFalse(models.ImportCheckpoint.objects.exists())
+
+    def test_other_imports_delete_checkpoint(self):
+        self._write_csv(self.rows)
+        for kwargs in ({}, {"incremental": True}, {"shadow_table": True}):
+            with self.subTest(**kwargs):
+                self._create_checkpoint(4)
+                self._import(stdout=StringIO(), **kwargs)
+                self.assertFalse(models.ImportCheckpoint.objects.exists())
+        # Otherwise, this would skip the first three rows
+        self._import(resume=True)
+        self.assertEqual(models.Carrier.objects.count(), 6)
+
+    def test_writes_heading_of_new_rejects_file(self):
+        self.rows[4] = make_row(46, hm="X")
+        self._write_csv(self.rows)
+        self._create_checkpoint(4)
+        rejects_filename = os.path.join(self.tempdir, "rejects.csv")
+        self._import(resume=True, max_errors=1, rejects=rejects_filename)
+        with open(rejects_filename, newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][:2], ["LINE", "ERROR"])
+        self.assertEqual(rows[1][0], "6")
+
+    def test_appends_to_existing_rejects_file(self):
+        self.rows[4] = make_row(46, hm="X")
+        self._write_csv(self.rows)
+        self._create_checkpoint(4)
+        rejects_filename = os.path.join(self.tempdir, "rejects.csv")
+        with open(rejects_filename, "w") as f:
+            f.write("LINE,ERROR\n2,Earlier error\n")
+        self._import(resume=True, max_errors=1, rejects=rejects_filename)
+        with open(rejects_filename, newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual([row[0] for row in rows], ["LINE", "2", "6"])
+
+    def test_reports_original_line_number(self):
+        self.rows[5] = make_row(47, hm="X")
+        self._write_csv(self.rows)
+        self._create_checkpoint(4)
+        with self.assertRaisesRegex(CommandError, "Error in line 7: "):
+            self._import(resume=True)
+
+    def test_ignores_checkpoint_of_other_file(self):
+        self._write_csv(self.rows)
+        self._create_checkpoint(4)
+        self._write_csv(self.rows[:5])
+        self._import(resume=True)
+        self.assertEqual(models.Carrier.objects.count(), 5)
+
+    def test_rejects_compressed_file(self):
+        self.filename += ".gz"
+        with self.assertRaisesRegex(CommandError, "uncompressed"):
+            self._import(resume=True)
+
+
+class IncrementalImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self._write_csv([make_row(42), make_row(43), make_row(44)])
+        self._import()
+        self.ids = dict(models.Carrier.objects.values_list("dot_number", "id"))
+        self._write_csv(
+            [make_row(42), make_row(43, legal_name="Changed"), make_row(45)]
+        )
+        self.stdout = StringIO()
+        self._import(incremental=True, batch_size=2, stdout=self.stdout)
+
+    def test_dot_numbers(self):
+        self.assertEqual(
+            list(models.Carrier.objects.values_list("dot_number", flat=True)),
+            [42, 43, 45],
+        )
+
+    def test_updates_changed_record_in_place(self):
+        carrier = models.Carrier.objects.get(dot_number=43)
+        self.assertEqual(carrier.legal_name, "Changed")
+        self.assertEqual(carrier.name, "Changed")
+        self.assertEqual(carrier.id, self.ids[43])
+
+    def test_keeps_unchanged_record(self):
+        self.assertEqual(models.Carrier.objects.get(dot_number=42).id, self.ids[42])
+
+    def test_reports_counts(self):
+        self.assertEqual(self.stdout.getvalue(), "1 inserted, 1 updated, 1 deleted\n")
+
+
+class DeferIndexesImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self.index_names = get_index_names(models.Carrier)
+        self.stdout = StringIO()
+
+    def test_imports_and_rebuilds_indexes(self):
+        self._write_csv([make_row(42), make_row(43)])
+        self._import(defer_indexes=True, stdout=self.stdout)
+        self.assertEqual(models.Carrier.objects.count(), 2)
+        self.assertEqual(get_index_names(models.Carrier), self.index_names)
+
+    def test_reports_index_build_times(self):
+        self._write_csv([make_row(42), make_row(43)])
+        self._import(defer_indexes=True, stdout=self.stdout)
+        lines = self.stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), len(models.Carrier._meta.indexes) + 1)
+        self.assertRegex(lines[0], r"^Built index \w+ in \d+\.\d s$")
+        self.assertRegex(lines[-1], r"^Built index name search in \d+\.\d s$")
+
+    def test_rebuilds_name_search_index(self):
+        self._write_csv([make_row(42, legal_name="Haulers United"), make_row(43)])
+        self._import(defer_indexes=True, stdout=self.stdout)
+        carriers = filter_by_name(models.Carrier.objects.all(), "haulers")
+        self.assertEqual([c.dot_number for c in carriers], [42])
+
+    def test_rebuilds_indexes_on_error(self):
+        self._write_csv([make_row(42), make_row(43, hm="X")])
+        with self.assertRaises(CommandError):
+            self._import(defer_indexes=True, stdout=self.stdout)
+        self.assertEqual(get_index_names(models.Carrier), self.index_names)
+
+
+class ShadowTableImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self._write_csv([make_row(42), make_row(43)])
+        self._import()
+
+    def test_replaces_records(self):
+        self._write_csv([make_row(44), make_row(45)])
+        self._import(shadow_table=True)
+        self.assertEqual(
+            list(models.Carrier.objects.values_list("dot_number", flat=True)), [44, 45],
+        )
+
+    def test_recreates_indexes(self):
+        index_names = get_index_names(models.Carrier)
+        self._write_csv([make_row(44), make_row(45)])
+        self._import(shadow_table=True)
+        self.assertEqual(get_index_names(models.Carrier), index_names)
+
+    def test_name_search_finds_new_records(self):
+        self._write_csv([make_row(44, legal_name="Haulers United"), make_row(45)])
+        self._import(shadow_table=True)
+        carriers = filter_by_name(models.Carrier.objects.all(), "haulers")
+        self.assertEqual([c.dot_number for c in carriers], [44])
+
+    def test_keeps_existing_records_on_error(self):
+        self._write_csv([make_row(44), make_row(45, hm="X")])
+        with self.assertRaises(CommandError):
+            self._import(shadow_table=True)
+        self.assertEqual(models.Carrier.objects.count(), 2)
+        self.assertNotIn(
+            "censuscrunch_carrier_new", connection.introspection.table_names()
+        )
+
+
+class ShadowTableTestCase(TestCase):
+    def _get_constraint(self, **kwargs):
+        result = dict.fromkeys(
+            ("primary_key", "unique", "foreign_key", "check", "index"), False
+        )
+        result.update(kwargs)
+        return result
+
+    def test_renames_postgresql_constraints(self):
+        # The tests run on SQLite, so check the DDL only
+        schema_editor = mock.Mock(quote_name=lambda name: f'"{name}"')
+        shadow_table = ShadowTable()
+        for name, constraint, expected in (
+            (
+                "censuscrunch_carrier_new_pkey",
+                self._get_constraint(primary_key=True, index=True),
+                'ALTER INDEX "censuscrunch_carrier_new_pkey" '
+                'RENAME TO "censuscrunch_carrier_pkey"',
+            ),
+            (
+                "censuscrunch_carrier_new_dot_number_key",
+                self._get_constraint(unique=True, index=True),
+                'ALTER INDEX "censuscrunch_carrier_new_dot_number_key" '
+                'RENAME TO "censuscrunch_carrier_dot_number_key"',
+            ),
+            (
+                "censuscrunch_carrier_new_name_idx",
+                self._get_constraint(index=True),
+                'ALTER INDEX "censuscrunch_carrier_new_name_idx" '
+                'RENAME TO "censuscrunch_carrier_name_idx"',
+            ),
+            (
+                "censuscrunch_carrier_new_dot_number_check",
+                self._get_constraint(check=True),
+                'ALTER TABLE "censuscrunch_carrier" RENAME CONSTRAINT '
+                '"censuscrunch_carrier_new_dot_number_check" '
+                'TO "censuscrunch_carrier_dot_number_check"',
+            ),
+            (
+                "censuscrunch_carrier_new_owner_id_fk",
+                self._get_constraint(foreign_key=("auth_user", "id")),
+                'ALTER TABLE "censuscrunch_carrier" RENAME CONSTRAINT '
+                '"censuscrunch_carrier_new_owner_id_fk" '
+                'TO "censuscrunch_carrier_owner_id_fk"',
+            ),
+        ):
+            with self.subTest(name=name):
+                schema_editor.execute.reset_mock()
+                shadow_table._rename_constraint(schema_editor, name, constraint)
+                schema_editor.execute.assert_called_once_with(expected)
+
+
+class StatsImportCsvTestCase(ImportCsvTestCaseBase):
+    def setUp(self):
+        super().setUp()
+        self._write_csv([make_row(n) for n in range(42, 47)])
+        self.stdout = StringIO()
+
+    def _read_json_lines(self):
+        return [json.loads(line) for line in self.stdout.getvalue().splitlines()]
+
+    def test_json_progress(self):
+        self._import(
+            json_progress=True, defer_indexes=True, max_errors=1, stdout=self.stdout
+        )
+        *index_events, result = self._read_json_lines()
+        self.assertEqual(len(index_events), len(models.Carrier._meta.indexes) + 1)
+        self.assertEqual(index_events[-1]["event"], "index_built")
+        self.assertEqual(index_events[-1]["name"], "name search")
+        self.assertEqual(result["event"], "done")
+        self.assertEqual(result["records"], 5)
+        self.assertEqual(result["rejected"], 0)
+        self.assertEqual(list(result["seconds"]), list(ImportStats.STAGES))
+
+    def test_json_progress_of_incremental_import(self):
+        self._import()
+        self._write_csv([make_row(n) for n in range(43, 48)])
+        self._import(incremental=True, json_progress=True, stdout=self.stdout)
+        [result] = self._read_json_lines()
+        self.assertEqual(
+            (result["inserted"], result["updated"], result["deleted"]), (1, 0, 1)
+        )
+
+    def test_summary(self):
+        self._import(verbosity=2, stdout=self.stdout)
+        lines = self.stdout.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("Time spent: delete "))
+        self.assertTrue(lines[1].startswith("5 records in "))
+
+    def test_no_summary_by_default(self):
+        self._import(stdout=self.stdout)
+        self.assertEqual(self.stdout.getvalue(), "")
+
+    def test_profile(self):
+        profile_filename = os.path.join(self.tempdir, "importcsv.prof")
+        self._import(profile=profile_filename)
+        self.assertGreater(pstats.Stats(profile_filename).total_calls, 0)
+
+
+class ImportStatsTestCase(TestCase):
+    def setUp(self):
+        self.stats = ImportStats()
+        self.stats.start_reading(1100, 100)
+
+    def test_eta(self):
+        with mock.patch("time.perf_counter", return_value=self.stats.start_time + 2):
+            self.stats.start_reading(1100, 100)
+        with mock.patch("time.perf_counter", return_value=self.stats.start_time + 5):
+            self.assertAlmostEqual(self.stats.get_eta(400), 7)
+
+    def test_no_eta_without_offset(self):
+        self.assertIsNone(self.stats.get_eta(None))
+
+    def test_no_eta_before_first_record(self):
+        self.assertIsNone(self.stats.get_eta(100))
+
+
+class ImportCsvErrorTestCase(ImportCsvTestCaseBase):
+    def test_bad_heading(self):
+        with open(self.filename, "w") as f:
+            f.write("DOT_NUMBER,LEGAL_NAME\n")
+        with self.assertRaisesRegex(CommandError, "expected heading"):
+            self._import()
+
+    def test_conversion_error_reports_line(self):
+        self._write_csv([make_row(42), make_row(43, hm="X")])
+        with self.assertRaisesRegex(CommandError, "Error in line 3: "):
+            self._import()
+
+    def test_blank_line_reports_line(self):
+        self._write_csv([make_row(42), "\n", make_row(43)])
+        with self.assertRaisesRegex(CommandError, "Error in line 3: "):
+            self._import()
+
+    def test_wrong_number_of_fields_reports_line(self):
+        self._write_csv([make_row(42), make_row(43).replace(',"A",', ",", 1)])
+        with self.assertRaisesRegex(
+            CommandError, "Error in line 3: expected 26 fields, got 25"
+        ):
+            self._import()
+
+    def test_integrity_error_in_batch_reports_line(self):
+        self._write_csv([make_row(42), make_row(43), make_row(44), make_row(43)])
+        with self.assertRaisesRegex(CommandError, "Error in line 5: "):
+            self._import(batch_size=10)
+
+
+class GetChunksTestCase(TestCase):
+    def test_chunks_end_at_line_boundaries(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b"aaaa\nbbbb\ncccc\ndd")
+            f.seek(5)
+            chunks = list(get_chunks(f, 3))
+        self.assertEqual(chunks, [(5, 10), (10, 15), (15, 17)])
+
+
+class CopyStreamTestCase(TestCase):
+    def setUp(self):
+        rows = [[42, "Killer, Inc", True, None, dt.date(2020, 3, 5)]] * 3
+        self.stream = CopyStream(rows)
+
+    def test_renders_csv(self):
+        self.assertEqual(
+            self.stream.read(), '42,"Killer, Inc",True,"","2020-03-05"\r\n' * 3
+        )
+
+    def test_reads_in_chunks(self):
+        chunks = [self.stream.read(10) for i in range(4)]
+        self.assertEqual(chunks[0], '42,"Killer, Inc",True,"","2020-03-05"\r\n')
+        self.assertEqual(chunks[3], "")
+
+
+class Str2dateTestCase(TestCase):
+    def test_converts_dates(self):
+        self.assertEqual(str2date("05-MAR-20"), dt.date(2020, 3, 5))
+        self.assertEqual(str2date("05-MAR-20"), dt.date(2020, 3, 5))
+        self.assertEqual(str2date("31-DEC-99"), dt.date(1999, 12, 31))
+
+    def test_empty_string(self):
+        self.assertIsNone(str2date(""))
@@ -1,8 +1,12 @@
+from unittest import skipUnless
+
+from django.db import connection
 from django.test import TestCase
 
 from model_mommy import mommy
 
 from censuscrunch import models
+from censuscrunch.pagination import Keyset
 
 
 class CarrierTestCase(TestCase):
@@ -65,6 +69,13 @@ class CarrierTestCase(TestCase):
         )
         self.assertEqual(str(carrier), "Killer Carrier, Inc")
 
+    def test_stores_name(self):
+        mommy.make(models.Carrier, legal_name="Killer Carrier, Inc", dba_name="")
+        carrier = models.Carrier.objects.get(name="Killer Carrier, Inc")
+        carrier.dba_name = "Killer Carrier"
+        carrier.save()
+        self.assertEqual(models.Carrier.objects.get().name, "Killer Carrier")
+
     def test_email_local_part(self):
         mommy.make(models.Carrier, email="hello@world.com")
         self.assertEqual(models.Carrier.objects.first().email_local_part, "hello")
@@ -83,3 +94,19 @@ class CarrierTestCase(TestCase):
     def test_email_with_link_when_empty(self):
         mommy.make(models.Carrier, email="")
         self.assertEqual(models.Carrier.objects.first().email_with_link, "")
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans")
+class CarrierIndexesTestCase(TestCase):
+    def _get_plan(self, sort_order):
+        queryset = Keyset(sort_order).order_by(models.Carrier.objects.all())
+        return queryset[:100].explain()
+
+    def test_sorts_by_index(self):
+        # Not the nullable columns; SQLite puts NULLs first in indexes, whereas we
+        # put them last, which it has to sort for.
+        for sort_order in ([], ["name"], ["-name"], ["physical_state", "name"]):
+            with self.subTest(sort_order=sort_order):
+                plan = self._get_plan(sort_order)
+                self.assertIn("USING INDEX", plan)
+                self.assertNotIn("TEMP B-TREE", plan)
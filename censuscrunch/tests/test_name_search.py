@@ -0,0 +1,68 @@
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+
+from model_mommy import mommy
+
+from censuscrunch import models
+from censuscrunch.name_search import filter_by_name
+
+
+class FilterByNameTestCase(TestCase):
+    def setUp(self):
+        mommy.make(
+            models.Carrier,
+            dot_number=42,
+            legal_name="Killer Carrier, Inc",
+            dba_name="Killer Carrier",
+        )
+        mommy.make(
+            models.Carrier, dot_number=43, legal_name="Transport Greatness", dba_name=""
+        )
+        mommy.make(
+            models.Carrier,
+            dot_number=44,
+            legal_name='Jociel "100%" Trucking',
+            dba_name="Johnson Logistics",
+        )
+        self.queryset = models.Carrier.objects.all()
+
+    def _search(self, term):
+        return set(filter_by_name(self.queryset, term))
+
+    def _icontains(self, term):
+        return set(
+            self.queryset.filter(
+                Q(legal_name__icontains=term) | Q(dba_name__icontains=term)
+            )
+        )
+
+    def test_same_result_as_icontains(self):
+        terms = ["killer", "KILLER", "er car", "logist", "a", "in", "xyz"]
+        terms += ['"100%"', "100%", "%", "r, i", "ness"]
+        for term in terms:
+            with self.subTest(term=term):
+                self.assertEqual(self._search(term), self._icontains(term))
+
+    def test_multiple_matches(self):
+        mommy.make(models.Carrier, dot_number=45, legal_name="Killer Haulers")
+        self.assertEqual(len(self._search("killer")), 2)
+
+    def test_uses_index_on_sqlite(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("The FTS table exists only on SQLite")
+        self.assertIn("MATCH", str(filter_by_name(self.queryset, "killer").query))
+
+    def test_short_term_does_not_use_index(self):
+        self.assertNotIn("MATCH", str(filter_by_name(self.queryset, "ki").query))
+
+    def test_follows_updates(self):
+        carrier = models.Carrier.objects.get(dot_number=43)
+        carrier.legal_name = "Haulers United"
+        carrier.save()
+        self.assertEqual(self._search("greatness"), set())
+        self.assertEqual(self._search("haulers"), {carrier})
+
+    def test_follows_deletions(self):
+        models.Carrier.objects.filter(dot_number=42).delete()
+        self.assertEqual(self._search("killer"), set())
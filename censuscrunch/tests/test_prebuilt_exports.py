@@ -0,0 +1,163 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from model_mommy import mommy
+
+from censuscrunch import models, prebuilt_exports
+
+CARRIERS = (
+    # dot_number, legal_name, physical_state
+    (44, "Lone Carrier", "CA"),
+    (42, "Killer Carrier", "NY"),
+    (43, "Transport Greatness", "NY"),
+    (45, "Nowhere Trucking", ""),
+)
+
+
+@override_settings(CENSUSCRUNCH_RESULT_CACHE_SIZE=0)
+class PrebuiltExportsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.exports_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.exports_dir)
+        for dot_number, legal_name, state in CARRIERS:
+            mommy.make(
+                models.Carrier,
+                dot_number=dot_number,
+                legal_name=legal_name,
+                physical_state=state,
+                mcs150_date=None,
+            )
+        models.DataGeneration.advance()
+        self._build_exports()
+
+    def _build_exports(self):
+        with self.settings(CENSUSCRUNCH_PREBUILT_EXPORTS_DIR=self.exports_dir):
+            prebuilt_exports.build_exports(models.DataGeneration.current())
+
+    def _get(self, query_string, prebuilt=True, **headers):
+        exports_dir = self.exports_dir if prebuilt else None
+        with self.settings(CENSUSCRUNCH_PREBUILT_EXPORTS_DIR=exports_dir):
+            return self.client.get("/?" + query_string, **headers)
+
+    def _get_content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_same_as_direct_download(self):
+        for query_string in (
+            "format=csv",
+            "state=NY&format=csv",
+            "state=ca&format=csv",
+        ):
+            with self.subTest(query_string=query_string):
+                expected = self._get_content(self._get(query_string, prebuilt=False))
+                r = self._get(query_string, HTTP_ACCEPT_ENCODING="gzip, deflate")
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual(r["Content-Encoding"], "gzip")
+                self.assertEqual(r["Content-Type"], "text/csv")
+                self.assertEqual(r["Vary"], "Accept-Encoding")
+                self.assertEqual(gzip.decompress(self._get_content(r)), expected)
+
+    def test_gzipped_csv(self):
+        expected = self._get_content(
+            self._get("state=NY&format=csv.gz", prebuilt=False)
+        )
+        r = self._get("state=NY&format=csv.gz", HTTP_RANGE="bytes=0-")
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r["Content-Type"], "application/gzip")
+        self.assertFalse(r.has_header("Content-Encoding"))
+        self.assertEqual(
+            gzip.decompress(self._get_content(r)), gzip.decompress(expected)
+        )
+
+    def test_decompresses_if_gzip_not_accepted(self):
+        expected = self._get_content(self._get("state=NY&format=csv", prebuilt=False))
+        r = self._get("state=NY&format=csv")
+        self.assertFalse(r.has_header("Content-Encoding"))
+        self.assertEqual(r["Accept-Ranges"], "none")
+        self.assertEqual(self._get_content(r), expected)
+        self.assertEqual(len(expected.splitlines()), 3)
+
+    def test_only_for_unsorted_searches_by_state(self):
+        for query_string in (
+            "state=NY&sort=name&format=csv",
+            "state=NY&q=carrier&format=csv",
+            "state=TX&format=csv",
+        ):
+            with self.subTest(query_string=query_string):
+                r = self._get(query_string, HTTP_ACCEPT_ENCODING="gzip")
+                self.assertFalse(r.has_header("Content-Encoding"))
+
+    def test_not_modified(self):
+        r = self._get("state=NY&format=csv", HTTP_ACCEPT_ENCODING="gzip")
+        etag = r["ETag"]
+        r = self._get(
+            "state=NY&format=csv", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(r.status_code, 304)
+        # The uncompressed representation has a different ETag
+        r = self._get("state=NY&format=csv", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+
+    def test_ranges(self):
+        content = self._get_content(
+            self._get("format=csv", HTTP_ACCEPT_ENCODING="gzip")
+        )
+        size = len(content)
+        for range_header, start, stop in (
+            ("bytes=0-9", 0, 10),
+            ("bytes=10-", 10, size),
+            ("bytes=-5", size - 5, size),
+            (f"bytes=5-{size + 100}", 5, size),
+        ):
+            with self.subTest(range_header=range_header):
+                r = self._get(
+                    "format=csv", HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE=range_header
+                )
+                self.assertEqual(r.status_code, 206)
+                self.assertEqual(r["Content-Range"], f"bytes {start}-{stop - 1}/{size}")
+                self.assertEqual(r["Content-Length"], str(stop - start))
+                self.assertEqual(self._get_content(r), content[start:stop])
+
+    def test_unsatisfiable_range(self):
+        r = self._get(
+            "format=csv", HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=100000-"
+        )
+        self.assertEqual(r.status_code, 416)
+        self.assertTrue(r["Content-Range"].startswith("bytes */"))
+
+    def test_ignored_ranges(self):
+        r = self._get("format=csv", HTTP_ACCEPT_ENCODING="gzip")
+        etag = r["ETag"]
+        for headers in (
+            {"HTTP_RANGE": "bytes=0-1,5-6"},
+            {"HTTP_RANGE": "bytes=5-2"},
+            {"HTTP_RANGE": "bytes=0-9", "HTTP_IF_RANGE": '"old"'},
+        ):
+            with self.subTest(headers=headers):
+                r = self._get("format=csv", HTTP_ACCEPT_ENCODING="gzip", **headers)
+                self.assertEqual(r.status_code, 200)
+        r = self._get(
+            "format=csv",
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_RANGE="bytes=0-9",
+            HTTP_IF_RANGE=etag,
+        )
+        self.assertEqual(r.status_code, 206)
+
+    def test_no_file_for_unknown_state(self):
+        with self.settings(CENSUSCRUNCH_PREBUILT_EXPORTS_DIR=self.exports_dir):
+            self.assertIsNone(prebuilt_exports.get_prebuilt_export("TX"))
+            self.assertIsNone(prebuilt_exports.get_prebuilt_export("../NY"))
+            self.assertIsNotNone(prebuilt_exports.get_prebuilt_export("NY"))
+
+    def test_removes_other_generations(self):
+        models.DataGeneration.advance()
+        self._build_exports()
+        self.assertEqual(os.listdir(self.exports_dir), ["2"])
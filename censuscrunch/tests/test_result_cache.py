@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from censuscrunch.result_cache import LRUCache
+
+
+class LRUCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        # Each of these values is 16 bytes pickled, so two fit
+        self.cache = LRUCache(max_size=40)
+
+    def test_get(self):
+        self.cache.set("a", "x")
+        self.assertEqual(self.cache.get("a"), "x")
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_returns_a_copy(self):
+        self.cache.set("a", ["x"])
+        self.cache.get("a").append("y")
+        self.assertEqual(self.cache.get("a"), ["x"])
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set("a", "x")
+        self.cache.set("b", "y")
+        self.cache.get("a")
+        self.cache.set("c", "z")
+        self.assertEqual(self.cache.get("a"), "x")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("c"), "z")
+
+    def test_size_is_bounded(self):
+        for i in range(10):
+            self.cache.set(i, str(i))
+        self.assertEqual(len(self.cache), 2)
+        self.assertLessEqual(self.cache.size, 40)
+
+    def test_replaces_value(self):
+        self.cache.set("a", "x")
+        self.cache.set("a", "y")
+        self.assertEqual(self.cache.get("a"), "y")
+        self.assertEqual(len(self.cache), 1)
+
+    def test_does_not_store_value_larger_than_max_size(self):
+        self.cache.set("a", "x" * 40)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_disabled(self):
+        cache = LRUCache(max_size=0)
+        cache.set("a", "x")
+        self.assertIsNone(cache.get("a"))
@@ -1,12 +1,18 @@
 import datetime as dt
 from io import StringIO
+from unittest import mock
 
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from bs4 import BeautifulSoup
 from model_mommy import mommy
 
 from censuscrunch import models, views
+from censuscrunch.counting import ResultCount
+from censuscrunch.result_cache import result_cache
 
 
 class CarrierListViewTestCase(TestCase):
@@ -146,7 +152,7 @@ class CarrierListCsvTestCase(TestCase):
         r = self.client.get("/?q=r&format=csv")
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r["Content-Type"], "text/csv")
-        result = StringIO(r.content.decode())
+        result = StringIO(b"".join(r.streaming_content).decode())
         header, first_line, second_line = result.readlines()
         self.assertEqual(
             header,
@@ -174,6 +180,30 @@ class CarrierListCsvTestCase(TestCase):
             '"03-JAN-19","","",""\r\n',
         )
 
+    def test_other_formats(self):
+        for format_name, content_type, filename in (
+            ("csv.gz", "application/gzip", "fmcsacensuscrunch.csv.gz"),
+            ("jsonl", "application/x-ndjson", "fmcsacensuscrunch.jsonl"),
+        ):
+            with self.subTest(format_name=format_name):
+                r = self.client.get(f"/?q=r&format={format_name}")
+                self.assertEqual(r["Content-Type"], content_type)
+                self.assertEqual(
+                    r["Content-Disposition"], f'attachment; filename="{filename}"'
+                )
+
+    def test_links_to_other_formats(self):
+        r = self.client.get("/?q=r")
+        self.assertContains(r, "?q=r&format=jsonl")
+
+    def test_csv_is_streamed_in_chunks(self):
+        with mock.patch.object(views.ExportResponse, "buffer_size", 1):
+            r = self.client.get("/?q=r&format=csv")
+            chunks = list(r.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[0].startswith(b'"DOT_NUMBER",'))
+        self.assertTrue(chunks[1].startswith(b"43,"))
+
 
 @override_settings(CENSUSCRUNCH_ROW_LIMIT=2)
 class CarrierListRowLimitTestCase(TestCase):
@@ -184,16 +214,36 @@ class CarrierListRowLimitTestCase(TestCase):
 
     def test_row_limit_message(self):
         r = self.client.get("/?max_number_of_power_units=15")
-        msg = "This search returns 3 rows. Change it so that it returns at most 2 rows."
+        msg = (
+            "This search returns more than 2 rows. "
+            "Change it so that it returns at most 2 rows."
+        )
+        self.assertContains(r, msg, html=True)
+
+    def test_estimated_row_count_message(self):
+        result_count = ResultCount(1_234_000, 2, estimated=True)
+        with mock.patch("censuscrunch.views.count_results", return_value=result_count):
+            r = self.client.get("/?max_number_of_power_units=15")
+        msg = (
+            "This search returns about 1,234,000 rows. "
+            "Change it so that it returns at most 2 rows."
+        )
         self.assertContains(r, msg, html=True)
 
     def test_no_results_if_above_row_limit(self):
         r = self.client.get("/?max_number_of_power_units=15")
         self.assertNotContains(r, "Name")
 
-    def test_no_csv_results_if_above_row_limit(self):
+    def test_export_link_if_above_row_limit(self):
+        r = self.client.get("/?max_number_of_power_units=15")
+        self.assertContains(r, "Export all of them as CSV")
+
+    @mock.patch("censuscrunch.export_jobs.submit")
+    def test_csv_above_row_limit_redirects_to_export_job(self, submit):
         r = self.client.get("/?max_number_of_power_units=15&format=csv")
-        self.assertEqual(r.status_code, 400)
+        job = models.ExportJob.objects.get()
+        self.assertRedirects(r, f"/exports/{job.id}/", fetch_redirect_response=False)
+        submit.assert_called_once_with(job.id)
 
 
 class CarrierListPaginationTestCaseBase(TestCase):
@@ -381,6 +431,89 @@ class CarrierListPaginationPageSix(CarrierListPaginationTestCaseBase):
         self.assertContains(self.r, self._get_expected_link(6, True), html=True)
 
 
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(views.SearchView, "paginate_by", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        power_units = [5, None, 3, 5, None, 1, 5]
+        states = ["NY", "CA", "NY", "MA", "NY", "CA", "CA"]
+        for i, (n, state) in enumerate(zip(power_units, states)):
+            mommy.make(
+                models.Carrier,
+                id=i + 1,
+                dot_number=50 - i,
+                legal_name=f"Carrier {i % 3}",
+                dba_name="",
+                physical_state=state,
+                number_of_power_units=n,
+            )
+
+    def _get_ids(self, response):
+        soup = BeautifulSoup(response.content, "lxml")
+        table_rows = soup.find("table").find_all("tr")[1:]
+        return [int(row.td.a["href"].split("/")[2]) for row in table_rows]
+
+    def _get_link(self, response, link_class):
+        soup = BeautifulSoup(response.content, "lxml")
+        return soup.find("a", class_=link_class).get("href")
+
+    def _get_pages(self, url, link_class="pagination-next"):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            pages.append(self._get_ids(response))
+            url = self._get_link(response, link_class)
+        return pages
+
+    def _get_all_ids(self, sort_order):
+        with mock.patch.object(views.SearchView, "paginate_by", 100):
+            return self._get_ids(self.client.get(self._get_url(sort_order)))
+
+    def _get_url(self, sort_order):
+        return "/?q=carrier" + "".join(f"&sort={x}" for x in sort_order)
+
+    def test_next_pages(self):
+        sort_orders = [[], ["number_of_power_units"], ["-number_of_power_units"]]
+        sort_orders += [["name"], ["-physical_state", "number_of_power_units"]]
+        for sort_order in sort_orders:
+            with self.subTest(sort_order=sort_order):
+                pages = self._get_pages(self._get_url(sort_order))
+                self.assertEqual(len(pages), 4)
+                self.assertEqual(sum(pages, []), self._get_all_ids(sort_order))
+
+    def test_previous_pages(self):
+        sort_order = ["-number_of_power_units", "physical_state"]
+        next_pages = self._get_pages(self._get_url(sort_order))
+        last_page_url = self._get_url(sort_order) + "&page=4"
+        previous_pages = self._get_pages(last_page_url, "pagination-previous")
+        self.assertEqual(previous_pages, next_pages[::-1])
+
+    def test_next_link(self):
+        response = self.client.get("/?q=carrier")
+        self.assertRegex(
+            self._get_link(response, "pagination-next"), r"^\?q=carrier&page=2&cursor="
+        )
+
+    def test_no_offset_with_cursor(self):
+        response = self.client.get("/?q=carrier&page=2")
+        url = self._get_link(response, "pagination-next")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse(any("OFFSET" in q["sql"] for q in queries.captured_queries))
+
+    def test_invalid_cursor_is_ignored(self):
+        response = self.client.get("/?q=carrier&page=2&cursor=garbage")
+        self.assertEqual(self._get_ids(response), self._get_all_ids([])[2:4])
+
+    def test_cursor_for_other_sort_order_is_ignored(self):
+        response = self.client.get("/?q=carrier")
+        url = self._get_link(response, "pagination-next") + "&sort=physical_state"
+        response = self.client.get(url)
+        all_ids = self._get_all_ids(["physical_state"])
+        self.assertEqual(self._get_ids(response), all_ids[2:4])
+
+
 class CarrierDetailTestCase(TestCase):
     def setUp(self):
         mommy.make(
@@ -513,3 +646,57 @@ class TableSortTestCase(TestCase):
         self.assertEqual(
             self._get_sort_order(["number_of_power_units", "name"]), [1, 4, 2, 3]
         )
+
+
+class ResultCacheTestCase(TestCase):
+    def setUp(self):
+        for c in (cache, result_cache):
+            c.clear()
+            self.addCleanup(c.clear)
+        mommy.make(
+            models.Carrier,
+            dot_number=42,
+            legal_name="Killer Carrier",
+            physical_state="NY",
+            number_of_power_units=5,
+        )
+        models.DataGeneration.advance()
+
+    def _add_carrier(self):
+        mommy.make(
+            models.Carrier,
+            dot_number=43,
+            legal_name="Another Carrier",
+            physical_state="NY",
+            number_of_power_units=5,
+        )
+
+    def test_hit_does_not_query_carriers(self):
+        self.client.get("/?state=NY")
+        with CaptureQueriesContext(connection) as queries:
+            r = self.client.get("/?state=ny")
+        self.assertContains(r, "Killer Carrier")
+        self.assertContains(r, "1 records")
+        table = models.Carrier._meta.db_table
+        self.assertFalse([q for q in queries if table in q["sql"]])
+
+    def test_cached_until_next_import(self):
+        self.client.get("/?state=NY")
+        self._add_carrier()
+        self.assertNotContains(self.client.get("/?state=NY"), "Another Carrier")
+        models.DataGeneration.advance()
+        self.assertContains(self.client.get("/?state=NY"), "Another Carrier")
+
+    def test_different_searches_are_cached_separately(self):
+        self.client.get("/?state=NY")
+        self._add_carrier()
+        self.assertContains(self.client.get("/?state=NY&sort=name"), "Another Carrier")
+        self.assertContains(self.client.get("/?q=another"), "Another Carrier")
+
+    def test_not_cached_when_disabled(self):
+        with override_settings(CENSUSCRUNCH_RESULT_CACHE_SIZE=0):
+            self.client.get("/?state=NY")
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get("/?state=NY")
+        table = models.Carrier._meta.db_table
+        self.assertTrue([q for q in queries if table in q["sql"]])
@@ -1,8 +1,14 @@
 from django.urls import path
 
-from .views import CarrierDetailView, SearchView
+from .views import CarrierDetailView, ExportJobDownloadView, ExportJobView, SearchView
 
 urlpatterns = [
     path("", SearchView.as_view()),
     path("carriers/<int:pk>/", CarrierDetailView.as_view(), name="carrier_detail"),
+    path("exports/<uuid:pk>/", ExportJobView.as_view(), name="export_job"),
+    path(
+        "exports/<uuid:pk>/download/",
+        ExportJobDownloadView.as_view(),
+        name="export_job_download",
+    ),
 ]
@@ -1,29 +1,56 @@
-import csv
-import datetime as dt
-from io import StringIO
+import gzip
+import os
+import re
 
 from django.conf import settings
-from django.db.models import F, Q
-from django.db.models.functions import Concat
-from django.http import HttpResponse
-from django.views.generic.detail import DetailView
+from django.core.paginator import Paginator
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.functional import cached_property
+from django.utils.http import quote_etag
+from django.views.generic.base import View
+from django.views.generic.detail import DetailView, SingleObjectMixin
 from django.views.generic.list import ListView
 
-from . import models
+from . import export, models
+from .columnar import SearchResult, get_engine
+from .counting import ResultCount, count_results, get_cache_key
+from .export_jobs import get_export_job
+from .name_search import filter_by_name
+from .pagination import Keyset, KeysetPaginator
+from .prebuilt_exports import get_prebuilt_export
+from .result_cache import result_cache
+
+# As in django.middleware.gzip
+ACCEPTS_GZIP_RE = re.compile(r"\bgzip\b")
+BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
 
 
 class SearchView(ListView):
     model = models.Carrier
     paginate_by = 100
+    paginator_class = KeysetPaginator
     template_name = "censuscrunch/search/main.html"
 
     def get(self, *args, **kwargs):
-        if self.request.GET.get("format") == "csv":
-            return self.get_csv(*args, **kwargs)
+        format_name = self.request.GET.get("format")
+        if format_name in export.FORMATS:
+            return self.get_export(format_name)
         else:
             return super().get(*args, **kwargs)
 
     def get_queryset(self):
+        queryset = self._get_database_queryset()
+        engine = get_engine() if self.request.GET else None
+        if engine is not None:
+            return engine.search(self.filters, self._get_sort_order())
+        return queryset
+
+    def _get_database_queryset(self):
+        # self.filters gets the normalised filters, which identify the search for
+        # caching purposes and for the columnar engine.
+        self.filters = {}
         if self.request.GET:
             queryset = super().get_queryset()
             queryset = self._filter_queryset(queryset)
@@ -41,33 +68,30 @@ class SearchView(ListView):
     def _filter_by_simple_search_term(self, queryset):
         search_term = self.request.GET.get("q")
         if search_term:
-            queryset = queryset.filter(
-                Q(legal_name__icontains=search_term)
-                | Q(dba_name__icontains=search_term)
-            )
+            self.filters["q"] = search_term
+            queryset = filter_by_name(queryset, search_term)
         return queryset
 
     def _filter_by_state(self, queryset):
-        state = self.request.GET.get("state", "").strip()
+        state = self.request.GET.get("state", "").strip().upper()
         if state:
-            queryset = queryset.filter(physical_state__iexact=state)
+            self.filters["state"] = state
+            queryset = queryset.filter(physical_state=state)
         return queryset
 
     def _filter_by_number_of_power_units(self, queryset):
         min_power_units = self.request.GET.get("min_number_of_power_units")
         max_power_units = self.request.GET.get("max_number_of_power_units")
         if min_power_units:
+            self.filters["min_number_of_power_units"] = min_power_units
             queryset = queryset.filter(number_of_power_units__gte=min_power_units)
         if max_power_units:
+            self.filters["max_number_of_power_units"] = max_power_units
             queryset = queryset.filter(number_of_power_units__lte=max_power_units)
         return queryset
 
     def _sort_queryset(self, queryset):
-        sort_order = self._get_sort_order()
-        if not sort_order:
-            return queryset
-        queryset = queryset.annotate(name=Concat(F("dba_name"), F("legal_name")))
-        return queryset.order_by(*sort_order)
+        return Keyset(self._get_sort_order()).order_by(queryset)
 
     def _get_sort_order(self):
         valid_fields = {
@@ -81,70 +105,226 @@ class SearchView(ListView):
         ]
         return sort_order
 
+    def get_paginator(self, queryset, per_page, **kwargs):
+        if isinstance(queryset, SearchResult):
+            return Paginator(queryset, per_page, **kwargs)
+        paginator = self.paginator_class(
+            queryset,
+            per_page,
+            keyset=Keyset(self._get_sort_order()),
+            cursor=self.request.GET.get("cursor"),
+            **kwargs,
+        )
+        if self.request.GET:
+            paginator.count = self.result_count.value
+        return paginator
+
+    def paginate_queryset(self, queryset, page_size):
+        # A cached page saves both the count and the query of the page's rows.
+        key = self._get_result_cache_key(page_size)
+        entry = result_cache.get(key) if key else None
+        if entry is not None:
+            self.result_count, number, object_list = entry
+            paginator = self.get_paginator(queryset, page_size)
+            page = paginator._get_page(object_list, number, paginator)
+            return paginator, page, page.object_list, page.has_other_pages()
+        paginator, page, object_list, is_paginated = super().paginate_queryset(
+            queryset, page_size
+        )
+        if key:
+            # Over the row limit the page is not shown, so don't fetch it.
+            rows = [] if self.result_count.exceeds_limit else list(object_list)
+            result_cache.set(key, (self.result_count, page.number, rows))
+        return paginator, page, object_list, is_paginated
+
+    def _get_result_cache_key(self, page_size):
+        if not self.request.GET or not result_cache.max_size:
+            return None
+        page = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg)
+        search = {
+            "filters": self.filters,
+            "sort": self._get_sort_order(),
+            "page": page or "1",
+            "cursor": self.request.GET.get("cursor"),
+            "page_size": page_size,
+            "limit": settings.CENSUSCRUNCH_ROW_LIMIT,
+        }
+        return get_cache_key("page", search)
+
+    @cached_property
+    def result_count(self):
+        if isinstance(self.object_list, SearchResult):
+            limit = settings.CENSUSCRUNCH_ROW_LIMIT
+            return ResultCount(len(self.object_list), limit)
+        return count_results(self.object_list, self.filters)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["row_limit"] = settings.CENSUSCRUNCH_ROW_LIMIT
+        if self.request.GET:
+            context["result_count"] = self.result_count
         context["searched"] = bool(self.request.GET)
         context["states"] = models.STATES
+        context["export_formats"] = export.FORMATS
         return context
 
-    def get_csv(self, *args, **kwargs):
-        return CsvResponse(self.get_queryset())
+    def get_export(self, format_name):
+        self.object_list = self._get_database_queryset()
+        prebuilt_export = self._get_prebuilt_export(format_name)
+        if prebuilt_export:
+            return get_prebuilt_export_response(
+                self.request, prebuilt_export, format_name
+            )
+        if self.result_count.exceeds_limit:
+            job = get_export_job(self.filters, self._get_sort_order(), format_name)
+            return redirect(job)
+        return ExportResponse(self.object_list, format_name)
 
+    def _get_prebuilt_export(self, format_name):
+        # Only unsorted CSV exports of a state, or of everything, have one
+        if format_name not in ("csv", "csv.gz"):
+            return None
+        if self._get_sort_order() or set(self.filters) - {"state"}:
+            return None
+        return get_prebuilt_export(self.filters.get("state"))
 
-class CsvResponse(HttpResponse):
-    def __init__(self, queryset):
-        self.queryset = queryset
-        if self.queryset.count() > settings.CENSUSCRUNCH_ROW_LIMIT:
-            super().__init__(status=400, reason="Too many rows")
-        else:
-            response_content = self._create_csv().encode("us-ascii")
-            super().__init__(response_content, content_type="text/csv")
-            self["Content-Disposition"] = 'attachment; filename="fmcsacensuscrunch.csv"'
-
-    def _create_csv(self):
-        self.csv = StringIO()
-        self.csvwriter = csv.writer(self.csv, quoting=csv.QUOTE_NONNUMERIC)
-        self._add_csv_header()
-        self._add_csv_body()
-        return self.csv.getvalue()
-
-    def _add_csv_header(self):
-        row = (
-            "DOT_NUMBER,LEGAL_NAME,DBA_NAME,CARRIER_OPERATION,HM_FLAG,PC_FLAG,"
-            "PHY_STREET,PHY_CITY,PHY_STATE,PHY_ZIP,PHY_COUNTRY,MAILING_STREET,"
-            "MAILING_CITY,MAILING_STATE,MAILING_ZIP,MAILING_COUNTRY,TELEPHONE,FAX,"
-            "EMAIL_ADDRESS,MCS150_DATE,MCS150_MILEAGE,MCS150_MILEAGE_YEAR,ADD_DATE,"
-            "OIC_STATE,NBR_POWER_UNIT,DRIVER_TOTAL"
-        ).split(",")
-        self.csvwriter.writerow(row)
-
-    def _add_csv_body(self):
-        for carrier in self.queryset:
-            self._add_csv_body_row(carrier)
-
-    def _add_csv_body_row(self, carrier):
-        attrs = (
-            "dot_number,legal_name,dba_name,carrier_operation,hm,pc,"
-            "physical_address,physical_city,physical_state,physical_zip,"
-            "physical_country,mailing_address,mailing_city,mailing_state,"
-            "mailing_zip,mailing_country,tel,fax,email,mcs150_date,mcs150_mileage,"
-            "mcs150_mileage_year,date_added_mcmis,oic_state,number_of_power_units,"
-            "number_of_drivers"
-        ).split(",")
-        values = [getattr(carrier, attr) for attr in attrs]
-        values = [self._format(v) for v in values]
-        self.csvwriter.writerow(values)
-
-    def _format(self, value):
-        if value is True or value is False:
-            return "NY"[value]
-        elif isinstance(value, dt.date):
-            return value.strftime("%d-%b-%y").upper()
-        else:
-            return value
+
+class ExportResponse(StreamingHttpResponse):
+    """The search results in one of export.FORMATS, streamed."""
+
+    chunk_size = 2000
+    buffer_size = 64 * 1024
+
+    def __init__(self, queryset, format_name):
+        export_format = export.FORMATS[format_name]
+        content = export_format.generate(
+            queryset, chunk_size=self.chunk_size, buffer_size=self.buffer_size
+        )
+        super().__init__(content, content_type=export_format.content_type)
+        self["Content-Disposition"] = _get_content_disposition(format_name)
+
+
+def _get_content_disposition(format_name):
+    return f'attachment; filename="{export.get_download_filename(format_name)}"'
+
+
+def get_prebuilt_export_response(request, filename, format_name):
+    """Return a response that serves a prebuilt export as CSV or gzipped CSV.
+
+    The gzipped CSV is the file. The CSV is the file with Content-Encoding gzip
+    if the client accepts gzip; otherwise it's decompressed on the fly. A single
+    byte range of the file can be requested, unless it's decompressed. The ETag
+    derives from the file's modification time and size, so it changes at every
+    import, and If-None-Match gets a 304.
+    """
+    stat = os.stat(filename)
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    if format_name == "csv.gz" or ACCEPTS_GZIP_RE.search(accept_encoding):
+        etag = quote_etag(etag + "-gzip")
+        response = _get_file_range_response(request, filename, stat.st_size, etag)
+        if format_name == "csv":
+            response["Content-Encoding"] = "gzip"
+    else:
+        etag = quote_etag(etag)
+        response = StreamingHttpResponse(_read_gzip_file(filename))
+        response["Accept-Ranges"] = "none"
+    response["Content-Type"] = export.FORMATS[format_name].content_type
+    response["Content-Disposition"] = _get_content_disposition(format_name)
+    response["ETag"] = etag
+    if format_name == "csv":
+        patch_vary_headers(response, ["Accept-Encoding"])
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def _get_file_range_response(request, filename, size, etag):
+    byte_range = _get_byte_range(request, size, etag)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    start, stop = byte_range or (0, size)
+    response = StreamingHttpResponse(_read_file(filename, start, stop))
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    response["Content-Length"] = stop - start
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _get_byte_range(request, size, etag):
+    """Return the (start, stop) of the requested range of the file, None for all
+    of it, or False if the range can't be satisfied.
+
+    Only single ranges are supported; other Range headers are ignored, as HTTP
+    allows, and so is a Range whose If-Range doesn't match the ETag.
+    """
+    match = BYTE_RANGE_RE.match(request.META.get("HTTP_RANGE", ""))
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not match or (if_range and if_range != etag):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None  # Invalid, e.g. "bytes=5-2"
+        stop = min(int(last) + 1, size) if last else size
+    elif last:
+        start, stop = max(size - int(last), 0), size
+        if not int(last):
+            return False
+    else:
+        return None
+    if start >= size:
+        return False
+    return start, stop
+
+
+def _read_file(filename, start, stop, block_size=64 * 1024):
+    with open(filename, "rb") as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _read_gzip_file(filename, block_size=64 * 1024):
+    with gzip.open(filename, "rb") as f:
+        yield from iter(lambda: f.read(block_size), b"")
 
 
 class CarrierDetailView(DetailView):
     model = models.Carrier
     template_name_suffix = "_detail/main"
+
+
+class ExportJobView(DetailView):
+    model = models.ExportJob
+    template_name_suffix = "_detail/main"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["export_format"] = export.FORMATS.get(self.object.format)
+        return context
+
+
+class ExportJobDownloadView(SingleObjectMixin, View):
+    queryset = models.ExportJob.objects.filter(status=models.ExportJob.DONE)
+
+    def get(self, *args, **kwargs):
+        job = self.get_object()
+        try:
+            f = open(job.filename, "rb")
+        except FileNotFoundError:
+            raise Http404("The file of this export has been removed.")
+        return FileResponse(
+            f,
+            as_attachment=True,
+            filename=export.get_download_filename(job.format),
+            content_type=export.FORMATS[job.format].content_type,
+        )
@@ -62,3 +62,25 @@ USE_TZ = True
 STATIC_URL = "/static/"
 
 CENSUSCRUNCH_ROW_LIMIT = 50_000
+
+# If set, on PostgreSQL, searches whose planner estimate is above this number of
+# rows (or above CENSUSCRUNCH_ROW_LIMIT) aren't counted; see censuscrunch.counting
+CENSUSCRUNCH_ESTIMATE_COUNTS_ABOVE = None
+
+# Per process, in bytes; see censuscrunch.result_cache
+CENSUSCRUNCH_RESULT_CACHE_SIZE = 32 * 1024 * 1024
+
+# If set (and NumPy is installed), importcsv writes the columns that searches use
+# to this directory, and searches use them; see censuscrunch.columnar
+CENSUSCRUNCH_COLUMNS_DIR = None
+
+# Searches that return more than CENSUSCRUNCH_ROW_LIMIT rows are exported in the
+# background, by this many worker processes, to files in this directory; with
+# zero workers, they are exported in the request. See censuscrunch.export_jobs
+CENSUSCRUNCH_EXPORTS_DIR = os.path.join(BASE_DIR, "exports")
+CENSUSCRUNCH_EXPORT_WORKERS = 2
+
+# If set, importcsv writes gzip-compressed CSV files of all carriers and of each
+# state's to this directory, and downloads of these are served from them; see
+# censuscrunch.prebuilt_exports
+CENSUSCRUNCH_PREBUILT_EXPORTS_DIR = None